@@ -26,17 +26,19 @@ class BabbleStream(object):
             will be recognized as referring to the first and second entity of
             each relation
         apply_filters: if True, apply the filter bank
+        parse_cache: an optional ParseCache (or path to one) for the parser
         seed: an optional seed for the CandidateGenerator
         verbose: controls verbosity of print statements
     """
     def __init__(self, Cs, Ys, aliases={}, entity_names=[], apply_filters=True,
-                 seed=None, verbose=True, **kwargs):
+                 parse_cache=None, seed=None, verbose=True, **kwargs):
         self.Cs = Cs
         self.Ys = Ys
         self.aliases = aliases
         self.verbose = verbose
         self.entity_names = entity_names
         self.apply_filters = apply_filters
+        self.parse_cache = parse_cache
 
         self.splits = list(range(len(self.Cs)))
         self.candidate_generator = CandidateGenerator(self, seed=seed, **kwargs)
@@ -68,18 +70,18 @@ class BabbleStream(object):
     def _build_semparser(self):
         self.semparser = SemanticParser(
             entity_names=self.entity_names,
-            aliases=self.aliases, beam_width=10)
+            aliases=self.aliases, beam_width=10, parse_cache=self.parse_cache)
 
     def add_aliases(self, new_aliases):
         """
-        Adds additional aliases and rebuilds SemanticParser.
+        Adds additional aliases to the SemanticParser's grammar.
 
         :param new_aliases: A dict {k: v, ...}
             k = (string) list name
             v = (list) words belonging to the alias
         """
         self.aliases.update(new_aliases)
-        self._build_semparser()
+        self.semparser.grammar.add_aliases(new_aliases)
 
     def preload(self, explanations=None, aliases=None, label_others=True):
         """
@@ -110,17 +112,20 @@ class BabbleStream(object):
         explanations = link_explanation_candidates(
             explanations, itertools.chain(*(self.Cs)))
 
-        parses, unparseable_explanations = self._parse(explanations)
+        parses, unparseable_explanations, budget_explanations = self._parse(
+            explanations)
         if self.apply_filters:
             parses, filtered_parses, label_matrix = self._filter(
                 parses, explanations, candidates)
         else:
             print("Because apply_filters=False, no parses are being filtered.")
             filtered_parses = {}
-            label_matrix = self.filter_bank.label(parses, candidates)
+            label_matrix = self.filter_bank.label(
+                parses, candidates, grammar=self.semparser.grammar)
 
         filtered_objects = filtered_parses
         filtered_objects['UnparseableExplanations'] = unparseable_explanations
+        filtered_objects['BudgetExceededExplanations'] = budget_explanations
 
         # Hold results in temporary space until commit
         self.temp_parses = parses if isinstance(parses, list) else [parses]
@@ -132,15 +137,26 @@ class BabbleStream(object):
     def _parse(self, explanations):
         """
         :param explanations: an Explanation or list of Explanations.
-        :return: a list of Parses.
+        :return: a list of Parses, the explanations that couldn't be parsed,
+            and the explanations whose parse exceeded a budget.
         """
+        explanations = explanations if isinstance(explanations, list) else [explanations]
         parses = self.semparser.parse(explanations,
             return_parses=True, verbose=self.verbose)
         used_explanations = set([p.explanation for p in parses])
-        unparseable_explanations = [FilteredExplanation(exp, 'Unparseable')
-            for exp in explanations if exp not in used_explanations]
+        unparseable_explanations = []
+        budget_explanations = []
+        for exp, budget in zip(explanations, self.semparser.budget_exceeded):
+            if budget is not None:
+                if exp in used_explanations:
+                    reason = "Budget exceeded ({}); only the parses found before it were kept.".format(budget)
+                else:
+                    reason = "Budget exceeded ({}); no parse was found.".format(budget)
+                budget_explanations.append(FilteredExplanation(exp, reason))
+            elif exp not in used_explanations:
+                unparseable_explanations.append(FilteredExplanation(exp, 'Unparseable'))
 
-        return parses, unparseable_explanations
+        return parses, unparseable_explanations, budget_explanations
 
     def _filter(self, parses, explanations, candidates):
         """
@@ -149,7 +165,8 @@ class BabbleStream(object):
             the parse(s) were produced.
         :return: the outputs from filter_bank.apply()
         """
-        return self.filter_bank.apply(parses, explanations, candidates)
+        return self.filter_bank.apply(parses, explanations, candidates,
+                                      grammar=self.semparser.grammar)
 
     def analyze(self, parses):
         lf_names = []
@@ -171,6 +188,7 @@ class BabbleStream(object):
 
         filter_names = [
             'UnparseableExplanations',
+            'BudgetExceededExplanations',
             'DuplicateSemanticsFilter',
             'ConsistencyFilter',
             'UniformSignatureFilter',
@@ -184,6 +202,8 @@ class BabbleStream(object):
             sum([len(p) for p in filtered_parses.values()])))
         print("{} Unparseable Explanation".format(
             len(filtered_parses.get('UnparseableExplanations', []))))
+        print("{} Budget Exceeded".format(
+            len(filtered_parses.get('BudgetExceededExplanations', []))))
         print("{} Duplicate Semantics".format(
             len(filtered_parses.get('DuplicateSemanticsFilter', []))))
         print("{} Inconsistency with Example".format(
@@ -201,7 +221,9 @@ class BabbleStream(object):
             for filtered_parse in parses:
                 num_filtered += 1
 
-                if filtered_parse.reason == 'Unparseable':
+                is_explanation = filter_name in ['UnparseableExplanations',
+                                                 'BudgetExceededExplanations']
+                if is_explanation:
                     parse_str = filtered_parse.parse.condition
                 else:
                     parse_str = self.semparser.grammar.translate(filtered_parse.parse.semantics)
@@ -210,6 +232,10 @@ class BabbleStream(object):
                     filter_str = "Unparseable Explanation"
                     reason_str = "This explanation couldn't be parsed."
 
+                elif filter_name == 'BudgetExceededExplanations':
+                    filter_str = "Budget Exceeded"
+                    reason_str = filtered_parse.reason
+
                 elif filter_name == 'DuplicateSemanticsFilter':
                     filter_str = "Duplicate Semantics"
                     reason_str = 'This parse is identical to one produced by the following explanation:\n\t"{}"'.format(
@@ -237,7 +263,7 @@ class BabbleStream(object):
 
                 print("\n[#{}]: {}".format(num_filtered, filter_str))
                 # print("\nFilter: {}".format(filter_str))
-                if filtered_parse.reason == 'Unparseable':
+                if is_explanation:
                     print("\nExplanation: {}".format(parse_str))
                 else:
                     print("\nParse: {}".format(parse_str))
@@ -299,22 +325,24 @@ class BabbleStream(object):
         self.temp_label_matrix = None
 
     def label_split(self, split):
-        """Label a single split with the most recently committed LFs."""
+        """
+        Label a single split with the most recently committed LFs, in one
+        pass over the candidates (see Grammar.plan).
+        """
         print("Applying labeling functions to split {}".format(split))
         lfs = [parse.function for parse in self.last_parses]
+        plan = self.semparser.grammar.plan(self.last_parses)
         candidates = self.Cs[split]
         num_existing_lfs = self.label_triples[split][4]
 
         rows = []
         cols = []
         data = []
-        pb = ProgressBar(len(candidates) * len(lfs))
-        count = 0
-        for j, lf in enumerate(lfs):
-            for i, c in enumerate(candidates):
-                pb.bar(count)
-                count += 1
-                label = int(lf(c))
+        pb = ProgressBar(len(candidates))
+        for i, c in enumerate(candidates):
+            pb.bar(i)
+            for j, output in enumerate(plan(c)):
+                label = int(output)
                 if label:
                     rows.append(i)
                     cols.append(j + num_existing_lfs)
@@ -1,3 +1,3 @@
-from .core_annotators import annotators, text2int
+from .core_annotators import annotators, is_number, text2int
 from .core_templates import PrimitiveTemplate
 from .core_base import core_grammar
\ No newline at end of file
@@ -3,6 +3,8 @@ import re
 from babble.parsing.annotator import Annotator
 
 class PunctuationAnnotator(Annotator):
+    categories = ['$Quote', '$OpenParen', '$CloseParen']
+
     def annotate(self, tokens):
         if len(tokens) == 1:
             if tokens[0]['pos'] in ["``", "\'\'"] or tokens[0]['word'] in ["'", '"']:
@@ -14,6 +16,8 @@ class PunctuationAnnotator(Annotator):
         return []
 
 class IntegerAnnotator(Annotator):
+    categories = ['$Int']
+
     def annotate(self, tokens):
         if len(tokens) == 1:
             value = None
@@ -23,11 +27,8 @@ class IntegerAnnotator(Annotator):
                     value = int(float(token))
                 except ValueError:
                     pass
-            if value is None:
-                try:
-                    value = text2int(tokens[0]['word'])
-                except:
-                    pass
+            if value is None and is_number(tokens[0]['word']):
+                value = text2int(tokens[0]['word'])
             if value is not None:
                 return [('$Int', ('.int', value))]
         return []
@@ -35,45 +36,52 @@ class IntegerAnnotator(Annotator):
 annotators = [PunctuationAnnotator(), IntegerAnnotator()]
 
 
-def text2int(textnum, numwords={}):
-    if not numwords:
-        units = [
+def _number_words():
+    units = [
         "zero", "one", "two", "three", "four", "five", "six", "seven", "eight",
         "nine", "ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen",
         "sixteen", "seventeen", "eighteen", "nineteen",
         ]
 
-        tens = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
+    tens = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
 
-        scales = ["hundred", "thousand", "million", "billion", "trillion"]
+    scales = ["hundred", "thousand", "million", "billion", "trillion"]
 
-        numwords["and"] = (1, 0)
-        for idx, word in enumerate(units):  numwords[word] = (1, idx)
-        for idx, word in enumerate(tens):       numwords[word] = (1, idx * 10)
-        for idx, word in enumerate(scales): numwords[word] = (10 ** (idx * 3 or 2), 0)
+    numwords = {"and": (1, 0)}
+    for idx, word in enumerate(units):  numwords[word] = (1, idx)
+    for idx, word in enumerate(tens):       numwords[word] = (1, idx * 10)
+    for idx, word in enumerate(scales): numwords[word] = (10 ** (idx * 3 or 2), 0)
+    return numwords
 
-    ordinal_words = {'first':1, 'second':2, 'third':3, 'fifth':5, 'eighth':8, 'ninth':9, 'twelfth':12}
-    ordinal_endings = [('ieth', 'y'), ('th', '')]
+# The number lexicon: the (scale, increment) of each number word (see text2int)
+NUMBER_WORDS = _number_words()
+ORDINAL_WORDS = {'first':1, 'second':2, 'third':3, 'fifth':5, 'eighth':8, 'ninth':9, 'twelfth':12}
+ORDINAL_ENDINGS = [('ieth', 'y'), ('th', '')]
 
-    textnum = textnum.replace('-', ' ')
+def number_word(word):
+    """Returns the (scale, increment) of a single number word, or None."""
+    if word in ORDINAL_WORDS:
+        return (1, ORDINAL_WORDS[word])
+    for ending, replacement in ORDINAL_ENDINGS:
+        if word.endswith(ending):
+            word = "%s%s" % (word[:-len(ending)], replacement)
+    return NUMBER_WORDS.get(word)
 
-    current = result = 0
-    for word in textnum.split():
-        if word in ordinal_words:
-            scale, increment = (1, ordinal_words[word])
-        else:
-            for ending, replacement in ordinal_endings:
-                if word.endswith(ending):
-                    word = "%s%s" % (word[:-len(ending)], replacement)
-
-            if word not in numwords:
-                raise Exception("Illegal word: " + word)
-
-            scale, increment = numwords[word]
+def is_number(textnum):
+    """Returns True if text2int can convert textnum (without raising)."""
+    return all(number_word(word) is not None
+               for word in textnum.replace('-', ' ').split())
 
+def text2int(textnum):
+    current = result = 0
+    for word in textnum.replace('-', ' ').split():
+        value = number_word(word)
+        if value is None:
+            raise Exception("Illegal word: " + word)
+        scale, increment = value
         current = current * scale + increment
         if scale > 100:
             result += current
             current = 0
 
-    return result + current
\ No newline at end of file
+    return result + current
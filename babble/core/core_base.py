@@ -10,6 +10,19 @@ from babble.parsing import (
     flip_dir,
     star,
 )
+from babble.parsing.aliases import map_in
+from babble.parsing.compiler import (
+    Func,
+    Value,
+    call_op,
+    composite_func_op,
+    composite_op,
+    func_op,
+    list_op,
+    literal_op,
+    map_op,
+    value_op,
+)
 from babble.core.core_templates import PrimitiveTemplate
 from babble.core.core_annotators import annotators
 
@@ -156,6 +169,66 @@ ops = {
     '.arg': lambda x: lambda c: c['candidate'][x(c) - 1],
     }
 
+def alias_map_op(compiler, func, list_):
+    """
+    Maps '.in' over an alias with map_in, which finds the entries that occur
+    in the container in one pass (see AliasList), and other funcs with map_op.
+    """
+    if (isinstance(func, Func) and func.sem and func.sem[0] == '.in' and func.args and
+            isinstance(list_, Value) and list_.sem and list_.sem[0] == '.alias'):
+        return Value('{}({}, {})'.format(
+            compiler.const(map_in), compiler.value(list_), func.args[0]))
+    return map_op(compiler, func, list_)
+
+# The Python expressions computed by the ops above (see LFCompiler)
+compile_ops = {
+    # root
+    '.root': value_op('{0}'),
+    '.label': value_op('{0} if {1} == True else 0'),
+    # primitives
+    '.bool': literal_op,
+    '.string': literal_op,
+    '.int': literal_op,
+    # lists
+    '.tuple': value_op('tuple({0})'),
+    '.list': list_op,
+    '.alias': value_op('aliases[{0}]'),
+    # apply a function x to elements in list y
+    '.map': alias_map_op,
+    # call a 'hungry' function with an argument
+    '.call': call_op,
+    # apply an instance of x to each element in y using a quantifier
+    '.composite_and': composite_op('all'),
+    '.composite_or': composite_op('any'),
+    # apply a list of functions to an argument
+    '.composite_and_func': composite_func_op('and'),
+    '.composite_or_func': composite_func_op('or'),
+    # logic
+    '.and': value_op('{0} == True and {1} == True'),
+    '.or': value_op('{0} == True or {1} == True'),
+    '.not': value_op('not {0} == True'),
+    '.all': value_op('all({v} == True for {v} in {0})'),
+    '.any': value_op('any({v} == True for {v} in {0})'),
+    '.none': value_op('not any({v} == True for {v} in {0})'),
+    # comparisons
+    '.eq': func_op('{y} == {0}'),
+    '.neq': func_op('{y} != {0}'),
+    '.lt': func_op('{y} < {0}'),
+    '.leq': func_op('{y} <= {0}'),
+    '.geq': func_op('{y} >= {0}'),
+    '.gt': func_op('{y} > {0}'),
+    # lists
+    '.in': func_op('{y} in {0}'),
+    '.contains': func_op('{0} in {y}'),
+    '.count': value_op('len({0})'),
+    '.sum': value_op('sum({0})'),
+    '.intersection': value_op('list(set({0}).intersection({1}))'),
+    '.all_equal': value_op('{all_equal}({0})',
+        all_equal=lambda mylist: all(mylist[0] == elem for elem in mylist)),
+    # context
+    '.arg': value_op('candidate[{0} - 1]'),
+}
+
 
 translate_ops = {
     '.root': lambda LF: LF,
@@ -205,6 +278,7 @@ translate_ops = {
 core_grammar = GrammarMixin(
     rules=rules,
     ops=ops,
+    compile_ops=compile_ops,
     helpers={},
     annotators=annotators,
     translate_ops=translate_ops
@@ -5,6 +5,7 @@ from metal.contrib.info_extraction.mentions import RelationMention
 from scipy.sparse import csr_matrix
 
 from babble.parsing import Parse
+from babble.parsing.parse import SemanticsTable
 from babble.utils import PrintTimer, ProgressBar
 
 FilteredParse = namedtuple('FilteredParse', ['parse', 'reason'])
@@ -18,8 +19,10 @@ class FilterBank(object):
         self.lowest_coverage_filter = LowestCoverageFilter()
         self.label_matrix = None
 
-    def apply(self, parses, explanations, candidates, parallelism=1):
+    def apply(self, parses, explanations, candidates, parallelism=1, grammar=None):
         """
+        :param grammar: if given, the Grammar used to label candidates with
+            all LFs in one pass (see FilterBank.label)
         Returns:
             parses: Parses
             filtered_parses: dict of Parses removed by each Filter
@@ -37,7 +40,7 @@ class FilterBank(object):
         if not parses: return parses, filtered_parses, None
 
         # Label and extract signatures
-        label_matrix = self.label(parses, candidates)
+        label_matrix = self.label(parses, candidates, grammar=grammar)
 
         # Apply signature based filters
         parses, rejected, label_matrix = self.uniform_filter.filter(parses, label_matrix)
@@ -55,16 +58,28 @@ class FilterBank(object):
 
         return parses, filtered_parses, label_matrix
 
-    def label(self, parses, candidates):
+    def label(self, parses, candidates, grammar=None):
+        """
+        :param grammar: if given, candidates are labeled by an evaluation
+            plan of the grammar (see Grammar.plan), which computes the
+            sub-expressions that LFs share once per candidate.
+        """
         print("Applying labeling functions to investigate labeling signature.")
         lfs = [parse.function for parse in parses]
         dense_label_matrix = np.zeros((len(candidates), len(lfs)))
 
-        pb = ProgressBar(len(lfs))
-        for j, lf in enumerate(lfs):
-            pb.bar(j)
+        if grammar is not None:
+            plan = grammar.plan(parses)
+            pb = ProgressBar(len(candidates))
             for i, c in enumerate(candidates):
-                dense_label_matrix[i, j] = lf(c)
+                pb.bar(i)
+                dense_label_matrix[i, :] = plan(c)
+        else:
+            pb = ProgressBar(len(lfs))
+            for j, lf in enumerate(lfs):
+                pb.bar(j)
+                for i, c in enumerate(candidates):
+                    dense_label_matrix[i, j] = lf(c)
         pb.close()
         label_matrix = csr_matrix(dense_label_matrix)
         return label_matrix
@@ -98,10 +113,20 @@ class Filter(object):
 
 
 class DuplicateSemanticsFilter(Filter):
-    """Filters out parses with identical logical forms (keeping one)."""
+    """
+    Filters out parses with identical logical forms (keeping one).
+
+    Parses come from different parses of explanations, so their semantics
+    are interned again into a SemanticsTable of the filter's own, and
+    parses are looked up by the identity of their canonical semantics.
+    """
     def __init__(self):
-        self.seen_semantics = {}        # key: semantics, value: parses
-        self.temp_seen_semantics = OrderedDict()   # key: semantics, value: parses
+        self.table = SemanticsTable()
+        self.seen_semantics = {}        # key: semantics key, value: parses
+        self.temp_seen_semantics = OrderedDict()   # key: semantics key, value: parses
+
+    def key(self, parse):
+        return SemanticsTable.key(self.table.intern(parse.semantics))
 
     def filter(self, parses):
         parses = self.validate(parses)
@@ -110,27 +135,32 @@ class DuplicateSemanticsFilter(Filter):
         good_parses = []
         bad_parses = []
         for parse in parses:
+            key = self.key(parse)
             # If a parse collides with a previously committed parse or a newly
             # seen temporary parse, add it to the bad parses and store the parse
             # that it collided with, for reference. Otherwise, add to good parses.
-            if parse.semantics in self.seen_semantics:
-                bad_parses.append(FilteredParse(parse, self.seen_semantics[parse.semantics]))
-            elif parse.semantics in self.temp_seen_semantics:
+            if key in self.seen_semantics:
+                bad_parses.append(FilteredParse(parse, self.seen_semantics[key]))
+            elif key in self.temp_seen_semantics:
                 # Store the removed parse, and the parse it collided with, for reference.
-                bad_parses.append(FilteredParse(parse, self.temp_seen_semantics[parse.semantics]))
+                bad_parses.append(FilteredParse(parse, self.temp_seen_semantics[key]))
             else:
                 good_parses.append(parse)
-                self.temp_seen_semantics[parse.semantics] = parse
+                self.temp_seen_semantics[key] = parse
 
         print("{} parse(s) remain ({} parse(s) removed by {}).".format(
             len(good_parses), len(bad_parses), self.name()))
         return good_parses, bad_parses
 
     def commit(self, idxs):
+        committed = list(self.seen_semantics.values())
         for i, (_, parse) in enumerate(self.temp_seen_semantics.items()):
              if i in idxs:
-                 self.seen_semantics[parse.semantics] =  parse
+                 committed.append(parse)
         self.temp_seen_semantics = OrderedDict()
+        # Only keep the semantics of committed parses in the table
+        self.table = SemanticsTable()
+        self.seen_semantics = dict((self.key(parse), parse) for parse in committed)
 
 
 class ConsistencyFilter(Filter):
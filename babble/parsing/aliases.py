@@ -0,0 +1,105 @@
+class SubstringAutomaton(object):
+    """
+    An Aho-Corasick automaton over the characters of a set of strings, which
+    finds all of them that occur in a text in one pass over the text.
+    """
+    def __init__(self, strings):
+        self.goto = [{}]
+        self.outputs = [set()]
+        for string in strings:
+            state = 0
+            for char in string:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = self.goto[state][char] = len(self.goto)
+                    self.goto.append({})
+                    self.outputs.append(set())
+                state = next_state
+            self.outputs[state].add(string)
+        # Breadth-first, so the fail state of each state is done before it
+        self.fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail
+                self.outputs[next_state] |= self.outputs[fail]
+                queue.append(next_state)
+        self.outputs = [frozenset(output) for output in self.outputs]
+
+    def find(self, text):
+        """Returns the set of the strings that occur in text."""
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        found = set(outputs[0])
+        state = 0
+        for char in text:
+            next_state = goto[state].get(char)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(char)
+            state = next_state or 0
+            if outputs[state]:
+                found |= outputs[state]
+        return found
+
+
+class AliasList(list):
+    """
+    A user list (alias) of a Grammar, indexed when it is added.
+
+    Membership tests (as in '.in' and '.contains') look entries up in a
+    frozenset instead of comparing against each of them, and map_in finds
+    which entries occur in a string with a SubstringAutomaton instead of
+    searching the string once per entry (for aliases of at least
+    min_automaton_size entries; below that, searching the string per entry
+    is faster). Entries should not be changed after the alias is added
+    (add the alias again instead).
+    """
+    min_automaton_size = 256
+
+    def __init__(self, entries=()):
+        super(AliasList, self).__init__(entries)
+        try:
+            self.members = frozenset(self)
+        except TypeError:
+            # Unhashable entries
+            self.members = None
+        self.automaton = None
+        if (len(self) >= self.min_automaton_size and
+                all(isinstance(entry, str) for entry in self)):
+            self.automaton = SubstringAutomaton(self.members)
+
+    def __contains__(self, item):
+        if self.members is not None:
+            try:
+                return item in self.members
+            except TypeError:
+                pass
+        return super(AliasList, self).__contains__(item)
+
+    def map_in(self, container):
+        """Returns [entry in container for entry in self]."""
+        if isinstance(container, str):
+            if self.automaton is not None:
+                found = self.automaton.find(container)
+                return [entry in found for entry in self]
+        elif isinstance(container, (list, tuple)) and self.members is not None:
+            try:
+                found = self.members.intersection(container)
+            except TypeError:
+                pass
+            else:
+                return [entry in found for entry in self]
+        return [entry in container for entry in self]
+
+
+def map_in(alias, container):
+    """Returns [entry in container for entry in alias]."""
+    if isinstance(alias, AliasList):
+        return alias.map_in(container)
+    return [entry in container for entry in alias]
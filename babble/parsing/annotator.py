@@ -1,5 +1,13 @@
 class Annotator:
-    """A base class for annotators."""
+    """
+    A base class for annotators.
+
+    Subclasses should list the categories they can return in categories, so
+    the grammar can tell which categories are productive (see
+    Grammar.prune_rules); None means they are unknown.
+    """
+    categories = None
+
     def annotate(self, tokens):
         """Returns a list of pairs, each a category and a semantic representation."""
         return []
\ No newline at end of file
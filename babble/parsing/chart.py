@@ -0,0 +1,169 @@
+from heapq import merge
+
+from babble.parsing.parse import SemanticsTable
+
+
+class ChartCell(object):
+    """
+    The parses covering a single span of the input.
+
+    Entries are kept in insertion order (which the beam relies on for breaking
+    ties), and are additionally grouped by their interned LHS category so that
+    rule application only has to visit category pairs the grammar can combine.
+    """
+    __slots__ = ('entries', 'categories', 'by_category')
+
+    def __init__(self):
+        self.entries = []
+        self.categories = []
+        self.by_category = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def add(self, parse, category):
+        self.by_category.setdefault(category, []).append(len(self.entries))
+        self.entries.append(parse)
+        self.categories.append(category)
+
+    def select(self, partners):
+        """
+        Returns the (parse, rules) pairs for all entries whose category is a
+        key of partners, in insertion order.
+        """
+        if len(partners) < len(self.by_category):
+            groups = [self.by_category[c] for c in partners if c in self.by_category]
+        else:
+            groups = [positions for c, positions in self.by_category.items() if c in partners]
+        if not groups:
+            return []
+        positions = groups[0] if len(groups) == 1 else merge(*groups)
+        return [(self.entries[p], partners[self.categories[p]]) for p in positions]
+
+    def pairs(self, right, binary_index):
+        """
+        Yields (parse_1, parse_2, rules) for every pair of entries from this
+        cell and the right cell that some binary rule can combine, in the same
+        order as iterating over the product of the two cells would.
+        """
+        selected = {}
+        for category, parse_1 in zip(self.categories, self.entries):
+            partners = binary_index.get(category)
+            if not partners:
+                continue
+            if category not in selected:
+                selected[category] = right.select(partners)
+            for parse_2, rules in selected[category]:
+                yield parse_1, parse_2, rules
+
+    def pack(self):
+        """
+        Merges entries with the same category and semantics into one, keeping
+        the derivation with the fewest absorbed tokens at the position of the
+        first. Semantics are only computed for categories with several
+        entries, and entries whose semantics are unhashable (the lists built
+        for n-ary rules) are kept as they are. Returns the number of entries
+        removed.
+        """
+        removed = set()
+        for positions in self.by_category.values():
+            if len(positions) < 2:
+                continue
+            seen = {}
+            for p in positions:
+                parse = self.entries[p]
+                try:
+                    q = seen.setdefault(SemanticsTable.key(parse.semantics), p)
+                except TypeError:
+                    continue
+                if q != p:
+                    removed.add(p)
+                    if parse.absorbed < self.entries[q].absorbed:
+                        self.entries[q] = parse
+        if removed:
+            entries = self.entries
+            categories = self.categories
+            self.entries = []
+            self.categories = []
+            self.by_category = {}
+            for p, (parse, category) in enumerate(zip(entries, categories)):
+                if p not in removed:
+                    self.add(parse, category)
+        return len(removed)
+
+    def truncate(self, order, width):
+        """Keeps the first width entries after sorting the cell by order."""
+        keep = sorted(range(len(self.entries)), key=lambda p: order(self.entries[p]))[:width]
+        entries = self.entries
+        categories = self.categories
+        self.entries = []
+        self.categories = []
+        self.by_category = {}
+        for p in keep:
+            self.add(entries[p], categories[p])
+
+
+class Chart(object):
+    """
+    A CKY chart over n tokens, stored as a triangular array of ChartCells.
+
+    Cell (i, j), with 0 <= i < j <= n, lives at index j * (j - 1) / 2 + i.
+    Indexing the chart with a span returns that cell's list of parses.
+
+    quote_counts[p] is the number of $Quote parses over the first p tokens,
+    absorb_candidates the number of parse pairs tried for absorption, and
+    packed the number of derivations merged into equivalent ones. size is
+    the number of parses added, and budget_exceeded names the first budget
+    of the Grammar the parse exceeded, if any. If absorb is False, no
+    parses that absorb tokens are added.
+
+    If predicted is set (by a LeftCornerPredictor), predicted[i] is the set of
+    categories that parses starting at i may have; other parses are dropped.
+    """
+    def __init__(self, n, category_ids, absorb=True):
+        self.n = n
+        self.category_ids = category_ids
+        self.cells = [None] * (n * (n + 1) // 2)
+        self.quote_counts = [0]
+        self.absorb_candidates = 0
+        self.packed = 0
+        self.size = 0
+        self.budget_exceeded = None
+        self.absorb = absorb
+        self.predicted = None
+
+    def index(self, i, j):
+        return j * (j - 1) // 2 + i
+
+    def cell(self, i, j):
+        idx = j * (j - 1) // 2 + i
+        cell = self.cells[idx]
+        if cell is None:
+            cell = self.cells[idx] = ChartCell()
+        return cell
+
+    def add(self, i, j, parse):
+        lhs = parse.rule.lhs
+        if self.predicted is not None and lhs not in self.predicted[i]:
+            return
+        category = self.category_ids.get(lhs)
+        if category is None:
+            category = self.category_ids[lhs] = len(self.category_ids)
+        self.cell(i, j).add(parse, category)
+        self.size += 1
+
+    def pack(self, i, j):
+        cell = self.cells[self.index(i, j)]
+        if cell is not None:
+            self.packed += cell.pack()
+
+    def keys(self):
+        return [(i, j) for j in range(1, self.n + 1) for i in range(j)
+                if self.cells[self.index(i, j)] is not None]
+
+    def __getitem__(self, span):
+        cell = self.cells[self.index(*span)]
+        return cell.entries if cell is not None else []
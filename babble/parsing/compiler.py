@@ -0,0 +1,331 @@
+from collections import Counter
+from string import Formatter
+
+
+class CompileError(Exception):
+    """Raised for semantics that the compile_ops of a grammar do not cover."""
+    pass
+
+
+# The kinds of compiled semantics nodes. A Value is an expression for what
+# the interpreted node returns when called with the context; a Func is a node
+# that takes another node (and the context) as its argument, as '.eq' and
+# '.upper' do, and Builder is a Func still missing its own argument, like
+# ('.eq',) in '.composite_and'. build records the semantics that each Value
+# and Func was compiled from in its sem, for compile ops that special-case
+# some of their arguments.
+class Raw(object):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Value(object):
+    __slots__ = ('expr', 'literal', 'sem')
+
+    def __init__(self, expr, literal=False):
+        self.expr = expr
+        self.literal = literal
+        self.sem = None
+
+
+class Func(object):
+    __slots__ = ('apply', 'args', 'sem')
+
+    def __init__(self, apply, args=None):
+        """
+        :param apply: maps the expression for the argument to an expression
+        :param args: the expressions of the op's own arguments, if known
+        """
+        self.apply = apply
+        self.args = args
+        self.sem = None
+
+
+class Builder(object):
+    __slots__ = ('build',)
+
+    def __init__(self, build):
+        """:param build: maps the expression for the missing argument to a Func"""
+        self.build = build
+
+
+class FuncList(object):
+    __slots__ = ('funcs',)
+
+    def __init__(self, funcs):
+        self.funcs = funcs
+
+
+class LFCompiler(object):
+    """
+    Compiles semantics into flat Python functions of a candidate.
+
+    Grammar.evaluate interprets semantics by nesting the closures of its ops,
+    and each call of the resulting LF walks all of them. The compiler instead
+    generates the source of a single function from the compile_ops of the
+    grammar's bases, which map each op to the Python expression it computes,
+    with the helpers used by the LF bound to locals. Functions are cached by
+    semantics, so LFs with the same semantics share their code.
+
+    Semantics that use ops without a compile_ops entry, or use ops in ways
+    their entries don't cover, are not compiled (compile returns None).
+
+    compile_plan compiles many LFs into one function, which evaluates the
+    sub-expressions they share only once per candidate (ops are assumed to
+    have no side effects).
+    """
+    def __init__(self, compile_ops, helpers, aliases):
+        self.compile_ops = compile_ops
+        self.helpers = helpers
+        self.aliases = aliases
+        self.cache = {}
+        self.shared = ()
+
+    def reset(self, shared=()):
+        self.namespace = {'helpers': self.helpers, 'aliases': self.aliases}
+        self.hoisted = []
+        self.num_vars = 0
+        self.shared = shared
+        self.slots = {}
+        self.slot_exprs = []
+
+    def compile(self, sem):
+        """Returns a function of a candidate computing the LF of sem, or None."""
+        try:
+            if sem in self.cache:
+                return self.cache[sem]
+        except TypeError:
+            return None
+        self.reset()
+        try:
+            expr = self.value(self.build(sem))
+        except CompileError:
+            function = None
+        else:
+            lines = ['def LF(candidate):']
+            lines += ['    {} = helpers[{!r}]'.format(self.helper_name(name), name)
+                      for name in self.hoisted]
+            lines.append('    return {}'.format(expr))
+            exec(compile('\n'.join(lines), '<LF>', 'exec'), self.namespace)
+            function = self.namespace['LF']
+        self.cache[sem] = function
+        return function
+
+    def compile_plan(self, semantics, fallbacks):
+        """
+        Returns a function of a candidate that returns the list of the
+        outputs of the LFs of semantics. Each sub-expression that is shared
+        by several of them is computed once, when it is first needed, and
+        kept in a slot for the rest of the candidate.
+
+        :param fallbacks: the LF used for each semantics that can't be
+            compiled
+        """
+        counts = Counter()
+        for sem in semantics:
+            count_subtrees(sem, counts)
+        self.reset(shared=set(s for s, count in counts.items() if count > 1))
+        exprs = []
+        for sem, fallback in zip(semantics, fallbacks):
+            try:
+                exprs.append(self.value(self.build(sem)))
+            except (CompileError, TypeError):
+                exprs.append('{}(candidate)'.format(self.const(fallback)))
+        unset = self.const(object())
+        lines = []
+        for k, expr in enumerate(self.slot_exprs):
+            lines += ['def _s{}(candidate, m):'.format(k),
+                      '    v = m[{}]'.format(k),
+                      '    if v is {}:'.format(unset),
+                      '        v = m[{}] = {}'.format(k, expr),
+                      '    return v']
+        lines += ['def PLAN(candidate):',
+                  '    m = [{}] * {}'.format(unset, len(self.slot_exprs)),
+                  '    return [{}]'.format(', '.join(exprs))]
+        for name in self.hoisted:
+            self.namespace[self.helper_name(name)] = self.helpers[name]
+        self.shared = ()
+        exec(compile('\n'.join(lines), '<PLAN>', 'exec'), self.namespace)
+        return self.namespace['PLAN']
+
+    def build(self, sem):
+        if not isinstance(sem, tuple):
+            return Raw(sem)
+        if sem in self.slots:
+            return self.slots[sem]
+        if not sem or sem[0] not in self.compile_ops:
+            raise CompileError(sem)
+        args = [self.build(arg) for arg in sem[1:]]
+        try:
+            node = self.compile_ops[sem[0]](self, *args)
+        except TypeError:
+            # The op was given a number of arguments its entry doesn't take
+            raise CompileError(sem)
+        if isinstance(node, (Value, Func)):
+            node.sem = sem
+        if sem in self.shared and isinstance(node, Value) and not node.literal:
+            slot = self.slots[sem] = Value('_s{}(candidate, m)'.format(len(self.slot_exprs)))
+            slot.sem = sem
+            self.slot_exprs.append(node.expr)
+            return slot
+        return node
+
+    def value(self, node):
+        """Returns the (parenthesized) expression of a Value node."""
+        if not isinstance(node, Value):
+            raise CompileError(node)
+        return '({})'.format(node.expr)
+
+    def func(self, node):
+        if not isinstance(node, Func):
+            raise CompileError(node)
+        return node
+
+    def literal(self, node):
+        """Returns an expression for the value of a Raw node."""
+        if not isinstance(node, Raw):
+            raise CompileError(node)
+        value = node.value
+        if value is None or type(value) in (bool, int, str):
+            return repr(value)
+        return self.const(value)
+
+    def const(self, value):
+        name = '_k{}'.format(len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def helper(self, name):
+        """Returns the local name bound to the helper called name."""
+        if name not in self.hoisted:
+            self.hoisted.append(name)
+        return self.helper_name(name)
+
+    @staticmethod
+    def helper_name(name):
+        return 'h_' + name
+
+    def var(self):
+        self.num_vars += 1
+        return '_v{}'.format(self.num_vars)
+
+
+def count_subtrees(sem, counts):
+    """Adds one to counts[s] for each occurrence of a subtree s of sem."""
+    if isinstance(sem, tuple):
+        try:
+            counts[sem] += 1
+        except TypeError:
+            return
+        for arg in sem[1:]:
+            count_subtrees(arg, counts)
+
+
+def _arity(template):
+    fields = [f for _, f, _, _ in Formatter().parse(template) if f is not None]
+    return len(set(f for f in fields if f.isdigit()))
+
+
+def _names(compiler, helpers, consts):
+    names = dict((name, compiler.helper(name)) for name in helpers)
+    names.update((name, compiler.const(value)) for name, value in consts.items())
+    return names
+
+
+def value_op(template, helpers=(), **consts):
+    """
+    Returns a compile op for an op whose arguments are all Values, and which
+    is a Value itself. In template, {0}, {1}, ... are the arguments, {v} is a
+    new variable for comprehensions, and helpers and consts are referred to
+    by name.
+    """
+    arity = _arity(template)
+    def op(compiler, *args):
+        if len(args) != arity:
+            raise CompileError(args)
+        names = _names(compiler, helpers, consts)
+        return Value(template.format(*[compiler.value(arg) for arg in args],
+                                     v=compiler.var(), **names))
+    return op
+
+
+def func_op(template, arity=1, helpers=(), **consts):
+    """
+    Returns a compile op for an op that takes arity Values and is a Func, or
+    a Builder if its single argument is missing. In template, {y} is the
+    Func's argument, and the rest are as for value_op.
+    """
+    def op(compiler, *args):
+        names = _names(compiler, helpers, consts)
+        def make(exprs):
+            return Func(lambda y: template.format(*exprs, y=y, **names), args=exprs)
+        if len(args) == arity:
+            return make([compiler.value(arg) for arg in args])
+        elif not args and arity == 1:
+            return Builder(lambda x: make([x]))
+        raise CompileError(args)
+    return op
+
+
+def literal_op(compiler, *args):
+    if len(args) != 1:
+        raise CompileError(args)
+    return Value(compiler.literal(args[0]), literal=True)
+
+
+def list_op(compiler, *args):
+    """A list of Values is a Value, and a list of Funcs is a FuncList."""
+    if args and all(isinstance(arg, Func) for arg in args):
+        return FuncList(args)
+    return Value('[{}]'.format(', '.join(compiler.value(arg) for arg in args)))
+
+
+def helper_op(name):
+    """Returns a compile op for calling the helper name with the op's Values."""
+    def op(compiler, *args):
+        return Value('{}({})'.format(compiler.helper(name),
+                     ', '.join(compiler.value(arg) for arg in args)))
+    return op
+
+
+def map_op(compiler, func, list_):
+    var = compiler.var()
+    return Value('[{} for {} in {}]'.format(
+        compiler.func(func).apply(var), var, compiler.value(list_)))
+
+
+def call_op(compiler, *args):
+    if len(args) != 2:
+        raise CompileError(args)
+    return Value(compiler.func(args[0]).apply(compiler.value(args[1])))
+
+
+def composite_op(quantifier):
+    """
+    Returns a compile op for applying a Builder to each element of a list,
+    and the resulting Funcs to the argument of the composite (quantifier is
+    'all' or 'any').
+    """
+    def op(compiler, builder, list_):
+        if not isinstance(builder, Builder):
+            raise CompileError(builder)
+        var = compiler.var()
+        list_expr = compiler.value(list_)
+        return Func(lambda y: '{}(({}) == True for {} in {})'.format(
+            quantifier, builder.build(var).apply(y), var, list_expr))
+    return op
+
+
+def composite_func_op(connective):
+    """
+    Returns a compile op for applying each Func of a FuncList to the argument
+    of the composite, joined by connective ('and' or 'or').
+    """
+    def op(compiler, funclist):
+        if not isinstance(funclist, FuncList):
+            raise CompileError(funclist)
+        return Func(lambda y: 'bool({})'.format(' {} '.format(connective).join(
+            '({}) == True'.format(func.apply(y)) for func in funclist.funcs)))
+    return op
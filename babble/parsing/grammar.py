@@ -1,63 +1,260 @@
 from __future__ import print_function
 
 from collections import defaultdict, namedtuple
-from itertools import product
+import heapq
 import re
-
+from time import time
 from types import FunctionType
 
+
 from babble.parsing.spacy.spacy_parser import Spacy
+from babble.parsing.aliases import AliasList
 from babble.parsing.rule import Rule, is_cat, is_optional
-from babble.parsing.parse import Parse
+from babble.parsing.parse import Parse, semantics_table
+from babble.parsing.chart import Chart
+from babble.parsing.compiler import LFCompiler
+from babble.parsing.helper_cache import HelperCache
+from babble.parsing.lexicon import TokenTrie
+from babble.parsing.prediction import LeftCornerPredictor
+from babble.parsing.profiler import PhaseTimer
+from babble.parsing.snapshot import (
+    GrammarSnapshot,
+    drop_optional,
+    fingerprint,
+    n_ary_head,
+    n_ary_tail,
+    _snapshots,
+)
 
 
 class GrammarMixin(object):
-    def __init__(self, rules, ops, helpers, annotators, translate_ops):
+    def __init__(self, rules, ops, helpers, annotators, translate_ops,
+                 compile_ops=None):
+        """
+        :param compile_ops: the Python expressions computed by ops, for
+            compiling LFs (see LFCompiler); ops without one are interpreted.
+        """
         self.rules = rules
         self.ops = ops
         self.helpers = helpers
         self.annotators = annotators
         self.translate_ops = translate_ops
+        self.compile_ops = compile_ops or {}
 
 
 class Grammar(object):
-    def __init__(self, bases, entity_names=[], aliases={},
-        beam_width=10, top_k=-1, start_symbol='$ROOT'):
+    # Categories whose rules are added after construction (user lists and
+    # entity names), which pruning must treat as productive and reachable
+    dynamic_categories = ['$UserList', '$ArgX']
 
+    def __init__(self, bases, entity_names=[], aliases={},
+        beam_width=10, top_k=-1, start_symbol='$ROOT', max_absorb_width=None,
+        snapshot=None, tokenization_cache_size=1024, profiler=None, prune=True,
+        engine='cky', max_parse_time=None, max_chart_entries=None,
+        max_absorb_candidates=None, tiered=False, fast_beam_width=None,
+        helper_cache_size=1024):
+        """
+        :param snapshot: a GrammarSnapshot (or the path to a saved one) of the
+            rules from bases; if None, the snapshot compiled earlier in this
+            process is used, or a new one is compiled.
+        :param tokenization_cache_size: the number of explanation strings whose
+            tokenization is kept by the (process-wide) spaCy parser.
+        :param profiler: an optional ParseProfiler that records each parse.
+        :param prune: if True, remove the rules from bases that can never be
+            part of a parse of start_symbol (see prune_rules).
+        :param engine: 'cky' to fill every cell bottom-up, or 'predictive' to
+            also drop parses that no parse of start_symbol could use given
+            the tokens to their left (see LeftCornerPredictor).
+        :param max_parse_time: a budget of seconds per parse
+        :param max_chart_entries: a budget of chart entries per parse
+        :param max_absorb_candidates: a budget of parse pairs considered for
+            absorption per parse
+            Once a parse exceeds any of its budgets, it stops filling its
+            chart and returns the parses found so far (see fill_chart), and
+            the reason is recorded in chart.budget_exceeded.
+        :param tiered: if True, each explanation is first parsed without
+            absorption, and parsed again with absorption only if that finds
+            fewer start_symbol parses than top_k asks for (see parse_tokens).
+        :param fast_beam_width: the beam width of the parse without
+            absorption (by default, beam_width). A narrower beam is faster,
+            but may drop parses that the full parse would return.
+        :param helper_cache_size: the number of helper results kept for the
+            candidate that LFs are being applied to (see HelperCache); if 0,
+            helper results are not cached.
+        """
         # Extract from bases
         bases = bases if isinstance(bases, list) else [bases]
         rules = []
         self.ops = {}
+        self.compile_ops = {}
         self.helpers = {}
         self.annotators = []
         self.translate_ops = {}
         for base in bases:
             rules += base.rules
             self.ops.update(base.ops)
+            # An op's compile op must come from the same base as the op
+            for name in base.ops:
+                self.compile_ops.pop(name, None)
+            self.compile_ops.update(base.compile_ops)
             self.helpers.update(base.helpers)
             self.annotators += base.annotators
             self.translate_ops.update(base.translate_ops)
 
-        # Add aliases and candidate-specific rules
-        self.aliases = aliases
-        for i, arg in enumerate(entity_names):
-            rules.append(Rule('$ArgX', arg, ('.arg', ('.int', i + 1))))
-
         # Set parameters
         self.beam_width = beam_width
         self.top_k = top_k
+        self.max_absorb_width = max_absorb_width
+        self.profiler = profiler
+        if engine not in ['cky', 'predictive']:
+            raise ValueError("Unknown parsing engine: {}".format(engine))
+        self.engine = engine
+        self.max_parse_time = max_parse_time
+        self.max_chart_entries = max_chart_entries
+        self.max_absorb_candidates = max_absorb_candidates
+        self.tiered = tiered
+        self.fast_beam_width = fast_beam_width or beam_width
 
         # Initialize
         self.categories = set()
+        self.category_ids = {}
         self.lexical_rules = defaultdict(list)
         self.unary_rules = defaultdict(list)
+        self.unary_closures = {}
         self.binary_rules = defaultdict(list)
+        self.binary_index = defaultdict(dict)
+        self.lexicon = TokenTrie()
+        self.rule_refs = []
         self.start_symbol = start_symbol
-        self.parser = Spacy()
-        for rule in rules:
-            self.add_rule(rule)
+        self.predictor = LeftCornerPredictor(self)
+        # Explanations only need words, POS and NER tags, so the dependency
+        # parser is not loaded and each explanation is a single sentence.
+        self.parser = Spacy.shared(annotators=['tagger', 'entity'],
+                                   cache_size=tokenization_cache_size)
+
+        # Add the compiled rules from the bases
+        self.fingerprint = fingerprint(rules)
+        if isinstance(snapshot, str):
+            snapshot = GrammarSnapshot.load(snapshot)
+        if snapshot is None:
+            snapshot = _snapshots.get(self.fingerprint)
+        if snapshot is None:
+            for k, rule in enumerate(rules):
+                self.add_rule(rule, ('rule', k))
+            snapshot = GrammarSnapshot(
+                [(rule.lhs, rule.rhs, ref) for rule, ref in self.rule_refs],
+                set(self.categories), self.fingerprint)
+            snapshot._rules = [rule for rule, _ in self.rule_refs]
+            _snapshots[self.fingerprint] = snapshot
+        else:
+            self.install_snapshot(snapshot, rules)
+        self.snapshot = snapshot
+        self.prune = prune
+        self.pruned_rules = []
+        if prune:
+            self.prune_rules()
+
+        # Add aliases and candidate-specific rules
+        self.aliases = {}
+        self.entity_names = []
+        self.add_entity_names(entity_names)
+        self.add_aliases(aliases)
+        self.helper_cache = None
+        if helper_cache_size:
+            self.helper_cache = HelperCache(self.helpers, max_size=helper_cache_size)
+            self.helpers = self.helper_cache.helpers
+        self.compiler = LFCompiler(self.compile_ops, self.helpers, self.aliases)
         print('Grammar construction complete.')
 
+    def prune_rules(self):
+        """
+        Removes the rules that can never be part of a parse of the start
+        symbol: those using an unproductive category (one that cannot cover
+        any tokens) and those whose LHS is unreachable from the start symbol.
+        Categories produced by lexical rules, annotators, and those in
+        dynamic_categories are productive. The removed rules are kept in
+        self.pruned_rules.
+        """
+        rules = [rule for rule, _ in self.rule_refs]
+        if any(annotator.categories is None for annotator in self.annotators):
+            productive = None
+        else:
+            productive = set(self.dynamic_categories)
+            for annotator in self.annotators:
+                productive.update(annotator.categories)
+            changed = True
+            while changed:
+                changed = False
+                for rule in rules:
+                    if rule.lhs not in productive and all(
+                            not is_cat(rhsi) or rhsi in productive for rhsi in rule.rhs):
+                        productive.add(rule.lhs)
+                        changed = True
+            rules = [rule for rule in rules if rule.lhs in productive and
+                     all(not is_cat(rhsi) or rhsi in productive for rhsi in rule.rhs)]
+        if self.start_symbol:
+            reachable = set([self.start_symbol]) | set(self.dynamic_categories)
+            changed = True
+            while changed:
+                changed = False
+                for rule in rules:
+                    if rule.lhs in reachable:
+                        for rhsi in rule.rhs:
+                            if is_cat(rhsi) and rhsi not in reachable:
+                                reachable.add(rhsi)
+                                changed = True
+            rules = [rule for rule in rules if rule.lhs in reachable]
+
+        kept = set(map(id, rules))
+        if len(kept) == len(self.rule_refs):
+            return
+        rule_refs = self.rule_refs
+        self.lexical_rules = defaultdict(list)
+        self.unary_rules = defaultdict(list)
+        self.binary_rules = defaultdict(list)
+        self.binary_index = defaultdict(dict)
+        self.lexicon = TokenTrie()
+        self.rule_refs = []
+        for rule, ref in rule_refs:
+            if id(rule) in kept:
+                self.install_rule(rule, ref)
+            else:
+                self.pruned_rules.append(rule)
+        self.categories = set(rule.lhs for rule, _ in self.rule_refs) & self.categories
+        print('Pruned {} rule(s) that cannot be part of a parse of {}.'.format(
+            len(self.pruned_rules), self.start_symbol))
+
+    def install_snapshot(self, snapshot, rules):
+        """Adds the compiled rules of snapshot, which must match rules."""
+        if snapshot.fingerprint != self.fingerprint:
+            raise ValueError("Grammar snapshot was compiled from different "
+                "rules than those provided by the grammar bases.")
+        for rule, (_, _, ref) in zip(snapshot.rules(rules), snapshot.entries):
+            self.install_rule(rule, ref)
+        self.categories.update(snapshot.categories)
+
+    def add_aliases(self, aliases):
+        """
+        Adds user lists to the grammar (without rebuilding it). Each list is
+        copied into an AliasList, which indexes its words for LFs.
+
+        :param aliases: A dict {k: v, ...}
+            k = (string) list name
+            v = (list) words belonging to the alias
+        """
+        for key, value in aliases.items():
+            self.aliases[key] = AliasList(value)
+            self.lexicon.entry(key.split(' ')).alias = key
+
+    def add_entity_names(self, entity_names):
+        """
+        Adds names that refer to the candidate's entities, in order (the first
+        name ever added refers to arg 1, the second to arg 2, and so on).
+        """
+        for arg in entity_names:
+            self.entity_names.append(arg)
+            self.add_rule(Rule('$ArgX', arg, ('.arg', ('.int', len(self.entity_names)))))
+
     def parse_string(self, string):
         """
         Returns the list of parses for the given string which can be derived
@@ -65,12 +262,40 @@ class Grammar(object):
 
         :param string:
         """
-        # Tokenize input string
+        if self.profiler is None:
+            return self.parse_tokens(self.tokenize(self.normalize(string)))
+        with PhaseTimer(self.profiler, 'tokenize'):
+            tokens = self.tokenize(self.normalize(string))
+        return self.parse_tokens(tokens)
+
+    def normalize(self, string):
+        """Strips a final period and collapses whitespace before tokenization."""
         assert(isinstance(string, str))
         if string.endswith('.'):
             string = string[:-1]
-        string = re.sub(r'\s+', ' ', string)
+        return re.sub(r'\s+', ' ', string)
+
+    def tokenize(self, string):
+        """
+        Returns the tokens of a normalized string, as dicts with a word, pos,
+        and ner, with <START> and <STOP> tokens added.
+        """
         output = self.parser.parse(None, string).__next__()
+        return self.make_tokens(output)
+
+    def tokenize_batch(self, strings, batch_size=1000):
+        """
+        Returns the tokens of each of the normalized strings (see tokenize),
+        running spaCy over them in batches of batch_size.
+        """
+        if self.profiler is None:
+            outputs = self.parser.parse_batch(strings, batch_size=batch_size)
+        else:
+            with PhaseTimer(self.profiler, 'tokenize'):
+                outputs = self.parser.parse_batch(strings, batch_size=batch_size)
+        return [self.make_tokens(output[0]) for output in outputs]
+
+    def make_tokens(self, output):
         tokens = list(map(lambda x: dict(zip(['word', 'pos', 'ner'], x)),
                      zip(output['words'], output['pos_tags'], output['ner_tags'])))
 
@@ -85,51 +310,168 @@ class Grammar(object):
         # Add start and stop _after_ parsing to not confuse the CoreNLP parser
         start = {'word': '<START>', 'pos': '<START>', 'ner': '<START>'}
         stop = {'word': '<STOP>', 'pos': '<STOP>', 'ner': '<STOP>'}
-        tokens = [start] + tokens + [stop]
+        return [start] + tokens + [stop]
+
+    def parse_tokens(self, tokens):
+        """
+        Returns the list of parses for the given tokens (see tokenize) which
+        can be derived using this grammar.
+
+        If the grammar is tiered and top_k only asks for the parses with the
+        fewest absorptions, the tokens are first parsed without absorption.
+        If that finds at least top_k (or, for top_k = -1, any) parses of
+        start_symbol, they are the parses the full parse would select, and
+        they are returned without it. They are also returned if the parse
+        without absorption exceeds a budget.
+        """
         words = [t['word'] for t in tokens]
         self.words = words # (for print_chart)
+        semantics_table.reset()
+        if self.profiler is not None:
+            self.profiler.start()
+
+        if self.tiered and self.start_symbol and self.top_k and self.top_k >= -1:
+            parses = self.fill_chart(tokens, words, absorb=False)
+            if (len(parses) >= max(self.top_k, 1) or
+                    self.chart.budget_exceeded is not None):
+                return self.select_top_k(parses)
+        parses = self.fill_chart(tokens, words)
+        if self.top_k:
+            parses = self.select_top_k(parses)
+        return parses
 
-        chart = defaultdict(list)
+    def fill_chart(self, tokens, words, absorb=True):
+        """
+        Fills a new chart (self.chart) for the given tokens and returns the
+        parses of start_symbol (or all parses, if it is None) over all of
+        them. If absorb is False, no tokens are absorbed and the beam is
+        fast_beam_width wide. Once the parse exceeds a budget, no more cells
+        are filled, so only parses over all tokens found by then (usually
+        none) are returned.
+        """
+        chart = Chart(len(tokens), self.category_ids, absorb=absorb)
+        beam_width = self.beam_width if absorb else self.fast_beam_width
+        budgeted = (self.max_parse_time or self.max_chart_entries or
+                    self.max_absorb_candidates)
+        start_time = time()
+        if self.engine == 'predictive' and self.start_symbol:
+            self.predictor.start(chart)
+        matches = self.lexicon.scan(words)
         for j in range(1, len(tokens) + 1):
             for i in range(j - 1, -1, -1):
-                self.apply_annotators(chart, tokens, i, j) # tokens[i:j] should be tagged?
-                self.apply_aliases(chart, words, i, j) # words[i:j] is the name of a UserList?
-                self.apply_lexical_rules(chart, words, i, j) # words[i:j] matches lexical rule?
-                self.apply_binary_rules(chart, i, j) # any split of words[i:j] matches binary rule?
-                self.apply_absorb_rules(chart, i, j)
-                self.apply_unary_rules(chart, i, j) # add additional tags if chart[(i,j)] matches unary rule
-                if self.beam_width:
-                    self.apply_beam(chart, i, j)
+                if self.profiler is not None:
+                    self.fill_cell_profiled(chart, tokens, words, matches, i, j, beam_width)
+                else:
+                    self.apply_annotators(chart, tokens, i, j) # tokens[i:j] should be tagged?
+                    self.apply_lexicon(chart, words, i, j, matches.get((i, j))) # words[i:j] is a UserList or lexical rule?
+                    self.apply_binary_rules(chart, i, j) # any split of words[i:j] matches binary rule?
+                    self.apply_absorb_rules(chart, i, j)
+                    self.apply_unary_rules(chart, i, j) # add additional tags if chart[(i,j)] matches unary rule
+                    chart.pack(i, j) # merge parses with the same category and semantics
+                    if beam_width:
+                        self.apply_beam(chart, i, j, beam_width)
+                if budgeted:
+                    self.check_budgets(chart, start_time)
+                    if chart.budget_exceeded is not None:
+                        break
+            if chart.budget_exceeded is not None:
+                break
+            self.count_quotes(chart, j)
+            if chart.predicted is not None and j < len(tokens):
+                self.predictor.predict(chart, j)
         parses = chart[(0, len(tokens))]
         if self.start_symbol:
             parses = [parse for parse in parses if parse.rule.lhs == self.start_symbol]
         self.chart = chart
-        if self.top_k:
-            # If top_k is negative, accept all parses that are tied for the
-            # fewest absorptions, then second fewest absorptions, ..., then k-fewest absorptions
-            if self.top_k < 0:
-                k = abs(self.top_k)
-                levels = sorted(list(set(p.absorbed for p in parses)))
-                parses = [p for p in parses if p.absorbed in levels[:k]]
-            else:
-                parses = sorted(parses, key=lambda x: x.absorbed)[:self.top_k]
         return parses
 
-    def add_rule(self, rule):
+    def check_budgets(self, chart, start_time):
+        """Records in chart.budget_exceeded the first budget the parse has exceeded."""
+        if self.max_parse_time and time() - start_time > self.max_parse_time:
+            chart.budget_exceeded = 'time'
+        elif self.max_chart_entries and chart.size > self.max_chart_entries:
+            chart.budget_exceeded = 'chart entries'
+        elif (self.max_absorb_candidates and
+                chart.absorb_candidates > self.max_absorb_candidates):
+            chart.budget_exceeded = 'absorb candidates'
+
+    def fill_cell_profiled(self, chart, tokens, words, matches, i, j, beam_width):
+        """Fills chart cell (i, j) as parse_tokens does, recording it in self.profiler."""
+        profiler = self.profiler
+        with PhaseTimer(profiler, 'annotators'):
+            self.apply_annotators(chart, tokens, i, j)
+        with PhaseTimer(profiler, 'lexicon'):
+            self.apply_lexicon(chart, words, i, j, matches.get((i, j)))
+        with PhaseTimer(profiler, 'binary'):
+            self.apply_binary_rules(chart, i, j)
+        with PhaseTimer(profiler, 'absorb'):
+            self.apply_absorb_rules(chart, i, j)
+        with PhaseTimer(profiler, 'unary'):
+            self.apply_unary_rules(chart, i, j)
+        entries = list(chart[(i, j)])
+        with PhaseTimer(profiler, 'pack'):
+            chart.pack(i, j)
+        packed = len(entries) - len(chart[(i, j)])
+        if beam_width:
+            with PhaseTimer(profiler, 'beam'):
+                self.apply_beam(chart, i, j, beam_width)
+        dropped = len(entries) - packed - len(chart[(i, j)])
+        if entries:
+            profiler.record_cell(i, j, words, entries, packed, dropped)
+
+    def select_top_k(self, parses):
+        """
+        Returns the best parses from the (packed) root cell by absorption,
+        without sorting the whole cell.
+        """
+        # If top_k is negative, accept all parses that are tied for the
+        # fewest absorptions, then second fewest absorptions, ..., then k-fewest absorptions
+        if self.top_k < 0:
+            levels = set(heapq.nsmallest(-self.top_k, set(p.absorbed for p in parses)))
+            return [p for p in parses if p.absorbed in levels]
+        else:
+            return heapq.nsmallest(self.top_k, parses, key=lambda x: x.absorbed)
+
+    def add_rule(self, rule, ref=None):
+        """
+        :param ref: a reference to the builder of the rule's semantics, for
+            GrammarSnapshots (see babble.parsing.snapshot.resolve).
+        """
+        ref = ref or ('value', rule.sem)
         if rule.contains_optionals():
-            self.add_rule_containing_optional(rule)
-        elif rule.is_lexical():
-            self.lexical_rules[rule.rhs].append(rule)
-        elif rule.is_unary():
-            self.unary_rules[rule.rhs].append(rule)
-        elif rule.is_binary():
-            self.binary_rules[rule.rhs].append(rule)
+            self.add_rule_containing_optional(rule, ref)
+        elif rule.is_lexical() or rule.is_unary() or rule.is_binary():
+            self.install_rule(rule, ref)
         elif all([is_cat(rhsi) for rhsi in rule.rhs]):
-            self.add_n_ary_rule(rule)
+            self.add_n_ary_rule(rule, ref)
         else:
             raise Exception('RHS mixes terminals and non-terminals: %s' % rule)
 
-    def add_rule_containing_optional(self, rule):
+    def install_rule(self, rule, ref):
+        """Adds a lexical, unary, or binary rule to the rule tables."""
+        if rule.is_lexical():
+            rules = self.lexical_rules[rule.rhs]
+            rules.append(rule)
+            self.lexicon.entry(rule.rhs).rules = rules
+        elif rule.is_unary():
+            self.unary_rules[rule.rhs].append(rule)
+            self.unary_closures = {}
+            self.predictor.reset()
+        else:
+            rules = self.binary_rules[rule.rhs]
+            rules.append(rule)
+            left, right = [self.intern_category(cat) for cat in rule.rhs]
+            self.binary_index[left][right] = rules
+            self.predictor.reset()
+        self.rule_refs.append((rule, ref))
+
+    def intern_category(self, category):
+        """Returns the small integer id used for category in the chart."""
+        if category not in self.category_ids:
+            self.category_ids[category] = len(self.category_ids)
+        return self.category_ids[category]
+
+    def add_rule_containing_optional(self, rule, ref=None):
         """
         Handles adding a rule which contains an optional element on the RHS.
         We find the leftmost optional element on the RHS, and then generate
@@ -151,16 +493,14 @@ class Grammar(object):
         suffix = rule.rhs[(first + 1):]
         # First variant: the first optional element gets deoptionalized.
         deoptionalized = (rule.rhs[first][1:],)
-        self.add_rule(Rule(rule.lhs, prefix + deoptionalized + suffix, rule.sem))
+        self.add_rule(Rule(rule.lhs, prefix + deoptionalized + suffix, rule.sem), ref)
         # Second variant: the first optional element gets removed.
         # If the semantics is a value, just keep it as is.
-        sem = rule.sem
         # But if it's a function, we need to supply a dummy argument for the removed element.
-        if isinstance(rule.sem, FunctionType):
-            sem = lambda sems: rule.sem(sems[:first] + [None] + sems[first:])
-        self.add_rule(Rule(rule.lhs, prefix + suffix, sem))
+        sem = drop_optional(rule.sem, first)
+        self.add_rule(Rule(rule.lhs, prefix + suffix, sem), ('optional', ref, first))
 
-    def add_n_ary_rule(self, rule):
+    def add_n_ary_rule(self, rule, ref=None):
         """
         Handles adding a rule with three or more non-terminals on the RHS.
         We introduce a new category which covers all elements on the RHS except
@@ -185,20 +525,29 @@ class Grammar(object):
             self.categories.add(name)
             return name
         category = add_category('%s_%s' % (rule.lhs, rule.rhs[0]))
-        self.add_rule(Rule(category, rule.rhs[1:], lambda sems: sems))
-        self.add_rule(Rule(rule.lhs, (rule.rhs[0], category),
-                            lambda sems: rule.apply_semantics([sems[0]] + sems[1])))
-
-    def apply_aliases(self, chart, words, i, j):
-        """Add parses to chart cell (i, j) by applying user lists."""
-        if self.aliases:
-            key = ' '.join(words[i:j])
-            if key in self.aliases:
-                lhs = '$UserList'
-                rhs = tuple(key.split())
-                semantics = ('.alias', ('.string', key))
-                rule = Rule(lhs, rhs, semantics)
-                chart[(i, j)].append(Parse(rule, words[i:j]))
+        self.add_rule(Rule(category, rule.rhs[1:], n_ary_tail(rule.sem)),
+                      ('n_ary_tail', ref))
+        self.add_rule(Rule(rule.lhs, (rule.rhs[0], category), n_ary_head(rule.sem)),
+                      ('n_ary_head', ref))
+
+    def apply_lexicon(self, chart, words, i, j, entry):
+        """
+        Add parses to chart cell (i, j) by applying user lists and lexical rules.
+
+        :param entry: the LexiconEntry for words[i:j], or None if no user list
+            or lexical rule matches it.
+        """
+        if entry is None:
+            return
+        if entry.alias is not None:
+            key = entry.alias
+            lhs = '$UserList'
+            rhs = tuple(key.split())
+            semantics = ('.alias', ('.string', key))
+            rule = Rule(lhs, rhs, semantics)
+            chart.add(i, j, Parse(rule, words[i:j]))
+        for rule in entry.rules:
+            chart.add(i, j, Parse(rule, words[i:j]))
 
     def apply_annotators(self, chart, tokens, i, j):
         """Add parses to chart cell (i, j) by applying annotators."""
@@ -207,46 +556,149 @@ class Grammar(object):
             for annotator in self.annotators:
                 for category, semantics in annotator.annotate(tokens[i:j]):
                     rule = Rule(category, tuple(words[i:j]), semantics)
-                    chart[(i, j)].append(Parse(rule, words[i:j]))
-
-    def apply_lexical_rules(self, chart, words, i, j):
-        """Add parses to chart cell (i, j) by applying lexical rules."""
-        for rule in self.lexical_rules[tuple(words[i:j])]:
-            chart[(i, j)].append(Parse(rule, words[i:j]))
+                    chart.add(i, j, Parse(rule, words[i:j]))
 
     def apply_binary_rules(self, chart, i, j):
         """Add parses to chart cell (i, j) by applying binary rules."""
+        predicted = chart.predicted[i] if chart.predicted is not None else None
         for k in range(i + 1, j):
-            for parse_1, parse_2 in product(chart[(i, k)], chart[(k, j)]):
-                for rule in self.binary_rules[(parse_1.rule.lhs, parse_2.rule.lhs)]:
-                    chart[(i, j)].append(Parse(rule, [parse_1, parse_2]))
+            for parse_1, parse_2, rules in chart.cell(i, k).pairs(chart.cell(k, j), self.binary_index):
+                for rule in rules:
+                    if predicted is not None and rule.lhs not in predicted:
+                        continue
+                    chart.add(i, j, Parse(rule, [parse_1, parse_2]))
 
     def apply_absorb_rules(self, chart, i, j):
-        """Add parses to chart cell (i, j) that require absorbing."""
-        if j - i > 2: # Otherwise, there's no chance for absorption
+        """
+        Add parses to chart cell (i, j) that require absorbing.
+
+        A binary rule may combine a parse of (i, m) with a parse of (n, j),
+        absorbing the n - m tokens in between. Absorbed spans are limited to
+        max_absorb_width tokens (if set) and may not contain an unmatched
+        quote mark. Every pair of parses considered for absorption is counted
+        in chart.absorb_candidates. Nothing is absorbed if chart.absorb is
+        False.
+        """
+        if j - i > 2 and chart.absorb: # Otherwise, there's no chance for absorption
+            width = self.max_absorb_width or j
+            predicted = chart.predicted[i] if chart.predicted is not None else None
             for m in range(i + 1, j - 1):
-                for n in range(m + 1, j):
-                    for parse_1, parse_2 in product(chart[(i, m)], chart[(n, j)]):
-                        # Don't absorb unmatched quote marks
-                        if sum(parse.rule.lhs=='$Quote' for p in range(m, n) for parse in chart[(p, p+1)]) % 2 != 0:
-                            break
-                        for rule in self.binary_rules[(parse_1.rule.lhs, parse_2.rule.lhs)]:
+                left = chart.cell(i, m)
+                # Only categories that start some binary rule can absorb
+                partners = set()
+                for category in left.by_category:
+                    partners.update(self.binary_index.get(category, ()))
+                if not partners:
+                    continue
+                for n in range(m + 1, min(j, m + width + 1)):
+                    right = chart.cell(n, j)
+                    if partners.isdisjoint(right.by_category):
+                        continue
+                    # Don't absorb unmatched quote marks
+                    if (chart.quote_counts[n] - chart.quote_counts[m]) % 2 != 0:
+                        continue
+                    absorbed = n - m
+                    for parse_1, parse_2, rules in left.pairs(right, self.binary_index):
+                        chart.absorb_candidates += 1
+                        for rule in rules:
                             # Don't allow $StringStub to absorb (to control growth)
                             if rule.lhs=='$StringStub':
                                 continue
-                            absorbed = n - m
-                            chart[(i, j)].append(Parse(rule, [parse_1, parse_2], absorbed))
+                            if predicted is not None and rule.lhs not in predicted:
+                                continue
+                            chart.add(i, j, Parse(rule, [parse_1, parse_2], absorbed))
+
+    def count_quotes(self, chart, j):
+        """Extends the chart's prefix sums of $Quote parses over single tokens."""
+        quotes = chart.cell(j - 1, j).by_category.get(self.intern_category('$Quote'), ())
+        chart.quote_counts.append(chart.quote_counts[-1] + len(quotes))
 
     def apply_unary_rules(self, chart, i, j):
-        """Add parses to chart cell (i, j) by applying unary rules."""
+        """
+        Add parses to chart cell (i, j) by applying unary rules, following
+        the unary closure of each parse's category one level at a time (so
+        parses are added in the same order as repeatedly applying unary rules
+        to the cell would).
+        """
+        chains = []
         for parse in chart[(i, j)]:
-            for rule in self.unary_rules[(parse.rule.lhs,)]:
-                chart[(i, j)].append(Parse(rule, [parse]))
+            levels = self.unary_closure(parse.rule.lhs)
+            if levels:
+                chains.append(([parse], levels))
+        depth = 0
+        while chains:
+            for parses, levels in chains:
+                for parent, rule in levels[depth]:
+                    parse = Parse(rule, [parses[parent]])
+                    parses.append(parse)
+                    chart.add(i, j, parse)
+            depth += 1
+            chains = [chain for chain in chains if len(chain[1]) > depth]
+
+    def unary_closure(self, category):
+        """
+        Returns the chains of unary rules that can be applied to a parse of
+        category, as a list of levels. Level d holds a (parent, rule) pair for
+        each chain of d + 1 rules, in breadth-first order, where parent is the
+        index (in that order, with 0 for the parse itself) of the chain the
+        rule extends. Chains that would revisit a category are cut.
+        """
+        levels = self.unary_closures.get(category)
+        if levels is None:
+            levels = []
+            frontier = [(0, (category,))]
+            count = 1
+            while frontier:
+                level = []
+                next_frontier = []
+                for parent, path in frontier:
+                    for rule in self.unary_rules.get((path[-1],), []):
+                        if rule.lhs in path:
+                            continue
+                        level.append((parent, rule))
+                        next_frontier.append((count, path + (rule.lhs,)))
+                        count += 1
+                if level:
+                    levels.append(level)
+                frontier = next_frontier
+            self.unary_closures[category] = levels
+        return levels
 
-    def apply_beam(self, chart, i, j):
-        chart[(i,j)] = sorted(chart[(i,j)], key=lambda x: x.absorbed)[:self.beam_width]
+    def apply_beam(self, chart, i, j, beam_width=None):
+        chart.cell(i, j).truncate(lambda x: x.absorbed, beam_width or self.beam_width)
 
     def evaluate(self, parse):
+        """
+        Returns the LF of parse, a function of a candidate. LFs are compiled
+        when the compile_ops of the grammar cover their semantics, and
+        interpreted otherwise.
+        """
+        compiled = self.compiler.compile(parse.semantics)
+        if compiled is not None:
+            # A new function object, so each LF can be named separately
+            return FunctionType(compiled.__code__, compiled.__globals__)
+        return self.interpret(parse.semantics)
+
+    def plan(self, parses):
+        """
+        Returns a function of a candidate that returns the list of the
+        outputs of the LFs of parses, computing the sub-expressions they
+        share only once (see LFCompiler.compile_plan). Helper results are
+        cached while the LFs are applied to each candidate.
+        """
+        plan = self.compiler.compile_plan(
+            [parse.semantics for parse in parses],
+            [parse.function or self.evaluate(parse) for parse in parses])
+        helper_cache = self.helper_cache
+        if helper_cache is None:
+            return plan
+        def cached_plan(candidate):
+            with helper_cache.candidate(candidate):
+                return plan(candidate)
+        return cached_plan
+
+    def interpret(self, semantics):
+        """Returns the LF of semantics built from the closures in ops."""
         def recurse(sem):
             if isinstance(sem, tuple):
                 op = self.ops[sem[0]]
@@ -254,7 +706,7 @@ class Grammar(object):
                 return op(*args) if args else op
             else:
                 return sem
-        LF = recurse(parse.semantics)
+        LF = recurse(semantics)
         return lambda candidate: LF({'helpers': self.helpers, 'aliases': self.aliases, 'candidate': candidate})
 
     def translate(self, sem):
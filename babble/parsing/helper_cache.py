@@ -0,0 +1,76 @@
+class HelperCache(object):
+    """
+    Memoizes the helpers of a grammar while LFs are applied to one candidate.
+
+    helpers maps each helper name to a wrapper of the helper. Between
+    start(candidate) and finish(), each wrapper returns the result of an
+    earlier call with the same (hashable) arguments instead of calling the
+    helper again, so LFs applied to the same candidate share the phrases
+    they build. finish() frees the results; outside of a candidate, the
+    wrappers just call the helpers. Helpers are assumed to have no side
+    effects and to return results that are not modified by their callers.
+
+        with grammar.helper_cache.candidate(c):
+            labels = [lf(c) for lf in lfs]
+
+    :param helpers: a dict {name: helper}
+    :param max_size: the number of results kept per candidate
+    """
+    def __init__(self, helpers, max_size=1024):
+        self.max_size = max_size
+        self.entries = None
+        self.current = None
+        self.hits = 0
+        self.misses = 0
+        self.helpers = dict((name, self.wrap(name, helper))
+                            for name, helper in helpers.items())
+
+    def wrap(self, name, helper):
+        def cached(*args, **kwargs):
+            entries = self.entries
+            if entries is None or kwargs:
+                return helper(*args, **kwargs)
+            key = (name, args)
+            try:
+                result = entries[key]
+            except KeyError:
+                pass
+            except TypeError:
+                # Unhashable arguments
+                return helper(*args)
+            else:
+                self.hits += 1
+                return result
+            self.misses += 1
+            result = helper(*args)
+            if len(entries) < self.max_size:
+                entries[key] = result
+            return result
+        cached.__name__ = getattr(helper, '__name__', name)
+        cached.__doc__ = getattr(helper, '__doc__', None)
+        return cached
+
+    def start(self, candidate):
+        """
+        Starts caching helper results for candidate (keeping those already
+        cached if candidate is the current candidate).
+        """
+        if self.entries is None or candidate is not self.current:
+            self.entries = {}
+        self.current = candidate
+
+    def finish(self):
+        """Frees the results cached for the current candidate."""
+        self.current = None
+        self.entries = None
+
+    def candidate(self, candidate):
+        """Returns a context manager that caches results for candidate."""
+        self.start(candidate)
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.finish()
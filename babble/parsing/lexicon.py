@@ -0,0 +1,43 @@
+class LexiconEntry(object):
+    """A node of a TokenTrie, holding whatever is keyed by its token sequence."""
+    __slots__ = ('children', 'rules', 'alias')
+
+    def __init__(self):
+        self.children = {}
+        self.rules = []
+        self.alias = None
+
+
+class TokenTrie(object):
+    """
+    A trie over token sequences for seeding the chart.
+
+    Each lexical rule is stored under its RHS and each user list (alias) under
+    its whitespace-separated name, so all matches starting at a position can be
+    found in a single walk that stops as soon as no key can be extended.
+    """
+    def __init__(self):
+        self.root = LexiconEntry()
+
+    def entry(self, tokens):
+        """Returns the entry for tokens, creating it if necessary."""
+        node = self.root
+        for token in tokens:
+            child = node.children.get(token)
+            if child is None:
+                child = node.children[token] = LexiconEntry()
+            node = child
+        return node
+
+    def scan(self, words):
+        """Returns a dict mapping each span (i, j) of words to its entry."""
+        matches = {}
+        for i in range(len(words)):
+            node = self.root
+            for j in range(i, len(words)):
+                node = node.children.get(words[j])
+                if node is None:
+                    break
+                if node.rules or node.alias is not None:
+                    matches[(i, j + 1)] = node
+        return matches
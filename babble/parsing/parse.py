@@ -5,30 +5,127 @@ from six import StringIO
 
 from babble.parsing.rule import Rule, is_cat
 
+class SemanticsTable(object):
+    """
+    An intern table for semantics.
+
+    intern returns one canonical copy of each distinct nested tuple, so that
+    equal semantics built by different derivations are the same object and
+    each subtree is stored once. Canonical tuples are keyed by the ids of
+    their (canonical) children, so interning a tuple built from interned
+    children only looks at its own elements, and a tuple whose children are
+    all canonical becomes canonical itself rather than being copied. Tuples
+    that contain lists (built for n-ary rules) are returned as they are.
+
+    Identity only stands for equality among semantics interned by the same
+    table since its last reset. Grammar resets semantics_table at the start
+    of every parse, so it only holds the semantics of the current parse.
+    """
+    def __init__(self):
+        self.table = {}
+        self.ids = set()
+
+    def __len__(self):
+        return len(self.table)
+
+    def intern(self, sem):
+        ids = self.ids
+        if sem.__class__ is not tuple or id(sem) in ids:
+            return sem
+        items = []
+        key = []
+        copy = False
+        for x in sem:
+            if x.__class__ is tuple:
+                if id(x) not in ids:
+                    y = self.intern(x)
+                    if id(y) not in ids:
+                        return sem
+                    copy = copy or y is not x
+                    x = y
+                key.append(id(x))
+            else:
+                key.append((x.__class__, x))
+            items.append(x)
+        key = tuple(key)
+        try:
+            canonical = self.table.get(key)
+        except TypeError:
+            return sem
+        if canonical is None:
+            canonical = self.table[key] = tuple(items) if copy else sem
+            ids.add(id(canonical))
+        return canonical
+
+    @staticmethod
+    def key(sem):
+        """
+        Returns a key for interned semantics that is equal for equal
+        semantics and cheap to hash.
+        """
+        return id(sem) if sem.__class__ is tuple else sem
+
+    def reset(self):
+        """
+        Empties the table. Semantics interned before a reset still compare
+        equal by value, but not by identity, to those interned after it.
+        """
+        self.table = {}
+        self.ids = set()
+
+
+semantics_table = SemanticsTable()
+
+
 class Parse(object):
+    __slots__ = ('rule', 'children', 'absorbed', 'function', 'explanation',
+                 '_semantics', '_has_semantics')
+
+    # If True, each Parse is validated when it is created
+    debug = False
+
     def __init__(self, rule, children, absorbed=0):
         self.rule = rule
-        self.children = tuple(children[:])
-        self.semantics = self.compute_semantics()
+        self.children = tuple(children)
+        self._semantics = None
+        self._has_semantics = False
         self.function = None
         self.explanation = None
-        self.absorbed = absorbed + sum(child.absorbed for child in self.children if isinstance(child, Parse))
-        self.validate_parse()
+        for child in self.children:
+            if isinstance(child, Parse):
+                absorbed += child.absorbed
+        self.absorbed = absorbed
+        if Parse.debug:
+            self.validate_parse()
+
+    @property
+    def semantics(self):
+        """The (interned) semantics of the parse, computed on first use."""
+        if not self._has_semantics:
+            self._semantics = semantics_table.intern(self.compute_semantics())
+            self._has_semantics = True
+        return self._semantics
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        return isinstance(other, Parse) and self._key() == other._key()
 
     def __ne__(self, other):
         return (not self.__eq__(other))
 
     def __hash__(self):
-        return hash(self.__repr__())
+        return hash(self._key())
+
+    def _key(self):
+        if self.function:
+            return self.function.__name__
+        else:
+            return (self.rule.lhs, self.semantics)
 
     def __repr__(self):
         if self.function:
             return "Parse({})".format(self.function.__name__)
         else:
-            return "Parse(hash={})".format(hash(self.semantics)[:8])
+            return "Parse(hash={:08x})".format(hash(self.semantics) & 0xffffffff)
 
     def validate_parse(self):
         assert isinstance(self.rule, Rule), 'Not a Rule: %s' % self.rule
@@ -41,7 +138,8 @@ class Parse(object):
                 assert self.rule.rhs[i] == self.children[i]
 
     def compute_semantics(self):
-        if self.rule.is_lexical():
+        # Only lexical rules have words (rather than Parses) as children
+        if not self.children or not isinstance(self.children[0], Parse):
             return self.rule.sem
         else:
             child_semantics = [child.semantics for child in self.children]
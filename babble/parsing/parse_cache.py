@@ -0,0 +1,139 @@
+from ast import literal_eval
+import hashlib
+import os
+import sqlite3
+import time
+
+from babble.parsing.parse import Parse
+from babble.parsing.rule import Rule
+
+# Increment whenever a change to the parser can change the parses it returns
+# for the same grammar, so that stale cache entries are never used.
+PARSER_VERSION = 2
+
+
+class ParseCache(object):
+    """
+    An on-disk cache mapping explanations to their parses.
+
+    Each entry maps a key (see key) to the list of (semantics, absorbed)
+    pairs of the explanation's parses. Entries are stored in a SQLite
+    database, so the cache can be shared by concurrent processes, and the
+    least recently used entries are evicted once the total size of the stored
+    values exceeds max_bytes.
+
+    :param fpath: the path of the database file
+    :param max_bytes: the maximum total size of the stored parses
+    """
+    def __init__(self, fpath, max_bytes=64 * 2**20):
+        self.fpath = fpath
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        return state
+
+    @property
+    def conn(self):
+        # Connections cannot be shared with forked processes, so each process
+        # opens its own.
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.fpath, timeout=60)
+            self._pid = os.getpid()
+            with self._conn:
+                self._conn.execute("CREATE TABLE IF NOT EXISTS parses ("
+                    "key TEXT PRIMARY KEY, value TEXT, size INTEGER, used REAL)")
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS parses_used ON parses (used)")
+        return self._conn
+
+    @staticmethod
+    def grammar_state(grammar):
+        """
+        Returns a digest of everything about grammar that can change the
+        parses of an explanation.
+        """
+        state = (
+            PARSER_VERSION,
+            grammar.fingerprint,
+            sorted((k, list(v)) for k, v in grammar.aliases.items()),
+            grammar.entity_names,
+            grammar.beam_width,
+            grammar.fast_beam_width if grammar.tiered else None,
+            grammar.top_k,
+            grammar.max_absorb_width,
+            grammar.start_symbol,
+            grammar.engine,
+            grammar.prune,
+        )
+        return hashlib.sha1(repr(state).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def key(state, string):
+        """
+        :param state: the grammar_state of the grammar
+        :param string: the normalized explanation string
+        """
+        return hashlib.sha1((state + string).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Returns the cached list of (semantics, absorbed) for key, or None."""
+        with self.conn as conn:
+            row = conn.execute(
+                "SELECT value FROM parses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE parses SET used = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        return literal_eval(row[0])
+
+    def put(self, key, parses):
+        """
+        Stores the (semantics, absorbed) of each parse under key. Parses
+        whose semantics cannot be written as a literal are not cached.
+        """
+        value = repr([(parse.semantics, parse.absorbed) for parse in parses])
+        try:
+            if literal_eval(value) != [(p.semantics, p.absorbed) for p in parses]:
+                return
+        except (ValueError, SyntaxError):
+            return
+        with self.conn as conn:
+            conn.execute("INSERT OR REPLACE INTO parses VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()))
+            self.evict(conn)
+
+    def evict(self, conn):
+        total = conn.execute("SELECT SUM(size) FROM parses").fetchone()[0] or 0
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, size FROM parses ORDER BY used").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM parses WHERE key = ?", stale)
+
+    def clear(self):
+        with self.conn as conn:
+            conn.execute("DELETE FROM parses")
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM parses").fetchone()[0]
+
+
+def cached_parse(semantics, absorbed, lhs='$ROOT'):
+    """
+    Returns a Parse with the given semantics and absorbed count, standing in
+    for a parse loaded from a ParseCache (it has no derivation).
+    """
+    return Parse(Rule(lhs, ('<cached>',), semantics), ('<cached>',), absorbed)
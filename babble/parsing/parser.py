@@ -1,21 +1,43 @@
+import multiprocessing
+
 from pandas import DataFrame, Series
 
 from metal.contrib.info_extraction.mentions import RelationMention
 
-from babble.core import core_grammar, text2int
+from babble.core import core_grammar, is_number
 from babble.text import text_grammar
 from babble.parsing import Grammar, stopword_list
+from babble.parsing.parse_cache import ParseCache, cached_parse
 from babble.explanation import Explanation
 
 class SemanticParser(object):
-    def __init__(self, string_format='implicit', **kwargs):
+    """
+    :param parse_cache: a ParseCache (or the path of its database) in which
+        the parses of explanations are stored and looked up.
+    :param parallelism: the number of worker processes used to parse lists
+        of explanations. Workers are forked (where supported), so they share
+        the grammar and spaCy model built in this process.
+
+    Parse budgets (max_parse_time, max_chart_entries, max_absorb_candidates)
+    are passed on to the Grammar. After each call to parse, budget_exceeded
+    holds, for each explanation, the budget its parse exceeded (or None).
+    """
+    def __init__(self, string_format='implicit', parse_cache=None,
+                 parallelism=1, **kwargs):
         grammar_mixins = [core_grammar, text_grammar]
         self.grammar = Grammar(grammar_mixins, **kwargs)
+        if isinstance(parse_cache, str):
+            parse_cache = ParseCache(parse_cache)
+        self.parse_cache = parse_cache
+        self.parallelism = parallelism
         self.string_format = string_format
         if string_format == 'implicit':
-            self.unquotable = [' '.join(key) for key in
-                self.grammar.lexical_rules] + stopword_list
+            # Words of pruned lexical rules are still grammar words, not strings
+            self.unquotable = frozenset([' '.join(key) for key in
+                self.grammar.lexical_rules] + [' '.join(rule.rhs) for rule
+                in self.grammar.pruned_rules if rule.is_lexical()] + stopword_list)
         self.explanation_counter = 0
+        self.budget_exceeded = []
 
     def name_explanations(self, explanations, names):
         if names:
@@ -30,11 +52,13 @@ class SemanticParser(object):
                 if not exp.name:
                     exp.name = "Explanation{}".format(i)
 
-    def parse(self, explanations, names=None, verbose=False, return_parses=False):
+    def parse(self, explanations, names=None, verbose=False, return_parses=False,
+              batch_size=1000):
         """
         Converts Explanation objects into labeling functions.
 
         :param explanations: An instance or list of Explanation objects
+        :param batch_size: the number of explanations tokenized by spaCy at once
         """
         LFs = []
         parses = []
@@ -42,11 +66,11 @@ class SemanticParser(object):
         explanations = explanations if isinstance(explanations, list) else [explanations]
         names = names if isinstance(names, list) or names is None else [names]
         self.name_explanations(explanations, names)
+        # Normalize all explanations first so they can be tokenized in batches
+        parses_by_exp = self.parse_strings(
+            [self.normalize(exp) for exp in explanations], batch_size=batch_size)
         for i, exp in enumerate(explanations):
-            exp_normalized = u'label {} if {}'.format(exp.label, exp.condition)
-            if self.string_format == 'implicit':
-                exp_normalized = self.mark_implicit_strings(exp_normalized, exp.candidate)
-            exp_parses = self.grammar.parse_string(exp_normalized)
+            exp_parses = parses_by_exp[i]
             num_parses_by_exp.append(len(exp_parses))
             for j, parse in enumerate(exp_parses):
                 parse.explanation = exp
@@ -65,11 +89,87 @@ class SemanticParser(object):
                 len(explanations)))
             print("{} {} generated from {} explanation(s).".format(
                 len(LFs), return_object, len(explanations)))
+            num_exceeded = len(self.budget_exceeded) - self.budget_exceeded.count(None)
+            if num_exceeded:
+                print("{} explanation(s) exceeded a parse budget.".format(num_exceeded))
         if return_parses:
             return parses
         else:
             return LFs
 
+    def parse_strings(self, strings, batch_size=1000):
+        """
+        Returns the list of parses of each of the normalized strings, taking
+        them from the parse cache (if any) when possible. The budget each
+        parse exceeded (or None) is stored in self.budget_exceeded; parses
+        cut short by a budget are not cached.
+        """
+        results = [None] * len(strings)
+        self.budget_exceeded = [None] * len(strings)
+        if self.parse_cache is not None:
+            state = ParseCache.grammar_state(self.grammar)
+            keys = [ParseCache.key(state, string) for string in strings]
+            lhs = self.grammar.start_symbol or '$ROOT'
+            for i, key in enumerate(keys):
+                cached = self.parse_cache.get(key)
+                if cached is not None:
+                    results[i] = [cached_parse(semantics, absorbed, lhs)
+                                  for semantics, absorbed in cached]
+        missing = [i for i, parses in enumerate(results) if parses is None]
+        if (self.parallelism > 1 and len(missing) > 1 and
+                'fork' in multiprocessing.get_all_start_methods()):
+            parses, reasons = self.parse_parallel(
+                [strings[i] for i in missing], batch_size)
+        else:
+            tokens = self.grammar.tokenize_batch(
+                [strings[i] for i in missing], batch_size=batch_size)
+            parses, reasons = [], []
+            for t in tokens:
+                parses.append(self.grammar.parse_tokens(t))
+                reasons.append(self.grammar.chart.budget_exceeded)
+        for i, exp_parses, reason in zip(missing, parses, reasons):
+            results[i] = exp_parses
+            self.budget_exceeded[i] = reason
+            if self.parse_cache is not None and reason is None:
+                self.parse_cache.put(keys[i], results[i])
+        return results
+
+    def parse_parallel(self, strings, batch_size=1000):
+        """
+        Returns the list of parses of each of the normalized strings, parsed
+        in chunks by self.parallelism forked workers, and the budget each
+        parse exceeded (or None). Workers only return the semantics and
+        absorbed count of each parse, so the Parses returned carry no
+        derivation (like those from the parse cache).
+        """
+        global _worker_parser
+        num_workers = min(self.parallelism, len(strings))
+        chunk_size = max(1, min(batch_size, -(-len(strings) // (4 * num_workers))))
+        chunks = [strings[i:i + chunk_size]
+                  for i in range(0, len(strings), chunk_size)]
+        _worker_parser = self
+        try:
+            pool = multiprocessing.get_context('fork').Pool(num_workers)
+            try:
+                outputs = pool.map(_parse_chunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            _worker_parser = None
+        lhs = self.grammar.start_symbol or '$ROOT'
+        outputs = [output for chunk_output in outputs for output in chunk_output]
+        parses = [[cached_parse(semantics, absorbed, lhs)
+                   for semantics, absorbed in pairs] for pairs, _ in outputs]
+        return parses, [reason for _, reason in outputs]
+
+    def normalize(self, exp):
+        """Returns the string to tokenize for the Explanation exp."""
+        exp_normalized = u'label {} if {}'.format(exp.label, exp.condition)
+        if self.string_format == 'implicit':
+            exp_normalized = self.mark_implicit_strings(exp_normalized, exp.candidate)
+        return self.grammar.normalize(exp_normalized)
+
     def parse_and_evaluate(self,
                            explanations,
                            show_everything=False,
@@ -249,15 +349,8 @@ class SemanticParser(object):
                     quote_list[-1][1] == i - 1 and  # The previous word was also added
                     ' '.join(condition_words[quote_list[-1][0]:i + 1]) in candidate_text):  # The complete phrase appears in candidate
                         quote_list[-1] = (quote_list[-1][0], i)
-                else:
-                    # Confirm it's not a number
-                    try:
-                        val = text2int(word)
-                    except:
-                        val = None
-
-                    if val is None:
-                        quote_list.append((i, i))
+                elif not is_number(word):
+                    quote_list.append((i, i))
             if word.endswith('"'):
                 quoting = False
         if not quote_list:
@@ -270,7 +363,8 @@ class SemanticParser(object):
         while i < len(condition_words):
             if j < len(quote_list) and i == quote_list[j][0]:
                 text_to_quote = ' '.join(condition_words[quote_list[j][0]:quote_list[j][1] + 1])
-                if text_to_quote.lower() in self.unquotable or all(w in self.unquotable for w in text_to_quote.lower().split()):
+                lowered = text_to_quote.lower()
+                if lowered in self.unquotable or self.unquotable.issuperset(lowered.split()):
                     j += 1
                 else:
                     new_condition_words.append('"{}"'.format(text_to_quote))
@@ -285,4 +379,15 @@ class SemanticParser(object):
 
     def translate(self, sem):
         """Converts a parse's semantics into a pseudocode string."""
-        return self.grammar.translate(sem)
\ No newline at end of file
+        return self.grammar.translate(sem)
+
+# The SemanticParser whose grammar forked workers use (see parse_parallel)
+_worker_parser = None
+
+def _parse_chunk(strings):
+    grammar = _worker_parser.grammar
+    outputs = []
+    for tokens in grammar.tokenize_batch(strings):
+        pairs = [(parse.semantics, parse.absorbed) for parse in grammar.parse_tokens(tokens)]
+        outputs.append((pairs, grammar.chart.budget_exceeded))
+    return outputs
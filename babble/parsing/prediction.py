@@ -0,0 +1,98 @@
+from babble.parsing.rule import is_cat
+
+
+class LeftCornerPredictor(object):
+    """
+    Top-down prediction for the 'predictive' parsing engine.
+
+    Before any parse starting at position p is added to the chart, the
+    predictor computes the categories that some derivation of the start
+    symbol can expect to begin at p: the left-corner closure of the
+    start symbol at p = 0, and afterwards of every category Y for which
+    a parse X over (k, e) can be the left child of a rule A -> X Y with A
+    predicted at k, where e = p or, to allow absorption, e is at most
+    max_absorb_width tokens before p. Parses of categories not predicted
+    at their start can never be part of a parse of the start symbol, so the
+    chart drops them (see Chart.add).
+
+    $Quote parses are always kept, since they determine which spans may be
+    absorbed.
+    """
+    always = frozenset(['$Quote'])
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.reset()
+
+    def reset(self):
+        """Clears the tables derived from the grammar's rules."""
+        self.left_corners = {}
+        self._left_rules = None
+        self._first_categories = None
+
+    @property
+    def left_rules(self):
+        """Maps each category X to the (A, Y) of every rule A -> X Y."""
+        if self._left_rules is None:
+            self._left_rules = {}
+            for rhs, rules in self.grammar.binary_rules.items():
+                self._left_rules.setdefault(rhs[0], []).extend(
+                    (rule.lhs, rhs[1]) for rule in rules)
+        return self._left_rules
+
+    @property
+    def first_categories(self):
+        """Maps each category to the categories that begin its unary and binary rules."""
+        if self._first_categories is None:
+            self._first_categories = {}
+            for table in [self.grammar.unary_rules, self.grammar.binary_rules]:
+                for rhs, rules in table.items():
+                    for rule in rules:
+                        self._first_categories.setdefault(rule.lhs, set()).add(rhs[0])
+        return self._first_categories
+
+    def left_corner_closure(self, category):
+        """Returns the categories that can begin a parse of category (including itself)."""
+        closure = self.left_corners.get(category)
+        if closure is None:
+            closure = set([category])
+            stack = [category]
+            while stack:
+                for first in self.first_categories.get(stack.pop(), ()):
+                    if is_cat(first) and first not in closure:
+                        closure.add(first)
+                        stack.append(first)
+            closure = self.left_corners[category] = frozenset(closure)
+        return closure
+
+    def closure(self, categories):
+        predicted = set(self.always)
+        for category in categories:
+            predicted |= self.left_corner_closure(category)
+        return predicted
+
+    def start(self, chart):
+        """Starts predicting for chart, from the grammar's start symbol at 0."""
+        chart.predicted = [self.closure([self.grammar.start_symbol])]
+        chart.continuations = [set()]
+
+    def predict(self, chart, p):
+        """
+        Sets the categories predicted at position p, once every cell of the
+        chart ending at p has been filled.
+        """
+        continuations = set()
+        left_rules = self.left_rules
+        for k in range(p):
+            predicted = chart.predicted[k]
+            for category in set(parse.rule.lhs for parse in chart[(k, p)]):
+                for lhs, right in left_rules.get(category, ()):
+                    if lhs in predicted:
+                        continuations.add(right)
+        chart.continuations.append(continuations)
+        width = self.grammar.max_absorb_width
+        first = max(0, p - width) if width else 0
+        expected = set()
+        for e in range(first, p + 1):
+            expected |= chart.continuations[e]
+        chart.predicted.append(self.closure(expected))
@@ -0,0 +1,131 @@
+from collections import Counter, OrderedDict
+import csv
+import json
+from time import time
+
+
+class ParseProfiler(object):
+    """
+    Records where a Grammar spends its time, aggregated over all the
+    explanations parsed while it is attached (Grammar(profiler=...)).
+
+    For each parse, the time spent in each phase of filling the chart, and
+    for each chart cell, the number of entries created, merged by packing,
+    dropped by the beam, and kept. Across parses, the number of entries each
+    rule and each category produced.
+
+    Only parses run in this process are recorded (not those run by
+    SemanticParser's forked workers).
+    """
+    phases = ['tokenize', 'annotators', 'lexicon', 'binary', 'absorb',
+              'unary', 'pack', 'beam']
+    cell_fields = ['parse', 'i', 'j', 'words', 'created', 'packed',
+                   'dropped', 'kept']
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.num_parses = 0
+        self.phase_times = OrderedDict((phase, 0.0) for phase in self.phases)
+        self.cells = []
+        self.rule_counts = Counter()
+        self.category_counts = Counter()
+
+    def start(self):
+        """Starts recording a new parse."""
+        self.num_parses += 1
+
+    def add_time(self, phase, seconds):
+        self.phase_times[phase] += seconds
+
+    def record_cell(self, i, j, words, entries, packed, dropped):
+        """
+        Records a finished chart cell.
+
+        :param entries: the parses created for the cell (before packing)
+        :param packed: the number of entries merged by packing
+        :param dropped: the number of entries dropped by the beam
+        """
+        for parse in entries:
+            self.rule_counts[rule_name(parse.rule)] += 1
+            self.category_counts[parse.rule.lhs] += 1
+        self.cells.append(OrderedDict(zip(self.cell_fields, [
+            self.num_parses - 1, i, j, ' '.join(words[i:j]),
+            len(entries), packed, dropped, len(entries) - packed - dropped])))
+
+    @property
+    def beam_dropped(self):
+        return sum(cell['dropped'] for cell in self.cells)
+
+    @property
+    def packed(self):
+        return sum(cell['packed'] for cell in self.cells)
+
+    def summary(self):
+        """Returns the recorded statistics as a dict (as written by to_json)."""
+        return OrderedDict([
+            ('num_parses', self.num_parses),
+            ('phase_times', self.phase_times),
+            ('entries', sum(cell['created'] for cell in self.cells)),
+            ('packed', self.packed),
+            ('beam_dropped', self.beam_dropped),
+            ('rule_counts', OrderedDict(self.rule_counts.most_common())),
+            ('category_counts', OrderedDict(self.category_counts.most_common())),
+            ('cells', self.cells),
+        ])
+
+    def to_json(self, fpath):
+        with open(fpath, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def to_csv(self, fpath, table='cells'):
+        """
+        Writes one of the recorded tables to a CSV file.
+
+        :param table: one of 'phases', 'rules', 'categories', or 'cells'
+        """
+        if table == 'cells':
+            header, rows = self.cell_fields, [list(c.values()) for c in self.cells]
+        elif table == 'phases':
+            header, rows = ['phase', 'seconds'], list(self.phase_times.items())
+        elif table == 'rules':
+            header, rows = ['rule', 'count'], self.rule_counts.most_common()
+        elif table == 'categories':
+            header, rows = ['category', 'count'], self.category_counts.most_common()
+        else:
+            raise ValueError("Unknown table: {}".format(table))
+        with open(fpath, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    def display(self, k=10):
+        """Prints the phase times and the k rules and categories that fired most."""
+        print("{} parse(s), {} chart entries ({} packed, {} dropped by the beam)".format(
+            self.num_parses, sum(cell['created'] for cell in self.cells),
+            self.packed, self.beam_dropped))
+        for phase, seconds in self.phase_times.items():
+            print("{:<12}{:.3f}s".format(phase, seconds))
+        for name, counts in [('RULES', self.rule_counts),
+                             ('CATEGORIES', self.category_counts)]:
+            print(name)
+            for key, count in counts.most_common(k):
+                print("{:>8}  {}".format(count, key))
+
+
+def rule_name(rule):
+    return '{} -> {}'.format(rule.lhs, ' '.join(rule.rhs))
+
+
+class PhaseTimer(object):
+    """Adds the time spent in a with block to a phase of a ParseProfiler."""
+    def __init__(self, profiler, phase):
+        self.profiler = profiler
+        self.phase = phase
+
+    def __enter__(self):
+        self.t0 = time()
+
+    def __exit__(self, type, value, traceback):
+        self.profiler.add_time(self.phase, time() - self.t0)
@@ -0,0 +1,143 @@
+import hashlib
+import pickle
+from types import BuiltinFunctionType, CodeType, FunctionType, ModuleType
+
+from babble.parsing.rule import Rule
+
+SNAPSHOT_VERSION = 1
+
+
+def drop_optional(sem, first):
+    """Semantics of a rule whose optional element at index first was removed."""
+    if isinstance(sem, FunctionType):
+        return lambda sems: sem(sems[:first] + [None] + sems[first:])
+    return sem
+
+def n_ary_tail(sem):
+    """Semantics of the new category covering all but the first RHS element."""
+    return lambda sems: sems
+
+def n_ary_head(sem):
+    """Semantics of an n-ary rule rewritten as its first element plus the tail."""
+    if isinstance(sem, FunctionType):
+        return lambda sems: sem([sems[0]] + sems[1])
+    return lambda sems: sem
+
+
+# Each ref names the builder that produced a rule's semantics, so that compiled
+# rules can be stored as plain data and their semantics rebuilt on load:
+#   ('rule', k): the semantics of the k-th rule contributed by the bases
+#   ('value', sem): a literal semantics
+#   (builder, ref, *args): builders[builder](resolved ref, *args)
+builders = {
+    'optional': drop_optional,
+    'n_ary_tail': n_ary_tail,
+    'n_ary_head': n_ary_head,
+}
+
+def resolve(ref, rules):
+    """Returns the semantics that ref describes, given the source rules."""
+    if ref[0] == 'rule':
+        return rules[ref[1]].sem
+    elif ref[0] == 'value':
+        return ref[1]
+    else:
+        return builders[ref[0]](resolve(ref[1], rules), *ref[2:])
+
+
+def fingerprint(rules):
+    """
+    Returns a digest of the given rules, including the code of their semantics
+    (with the names it calls, its defaults and the globals it refers to).
+    """
+    seen = set()
+    def signature(obj, namespace=None):
+        if isinstance(obj, FunctionType):
+            if id(obj) in seen:
+                # A recursive helper
+                return ('fn', obj.__module__, obj.__qualname__)
+            seen.add(id(obj))
+            cells = obj.__closure__ or ()
+            kwdefaults = sorted((obj.__kwdefaults__ or {}).items())
+            return ('fn', signature(obj.__code__, obj.__globals__),
+                    signature(obj.__defaults__ or ()),
+                    tuple((k, signature(v)) for k, v in kwdefaults),
+                    tuple(signature(cell.cell_contents) for cell in cells))
+        elif isinstance(obj, CodeType):
+            names = obj.co_names
+            if namespace is not None:
+                names = tuple((name, signature(namespace[name]))
+                              if name in namespace else name for name in names)
+            return ('code', obj.co_code, names,
+                    tuple(signature(c, namespace) for c in obj.co_consts))
+        elif isinstance(obj, ModuleType):
+            return ('module', obj.__name__)
+        elif isinstance(obj, (type, BuiltinFunctionType)):
+            return (type(obj).__name__, obj.__module__, obj.__qualname__)
+        elif isinstance(obj, (tuple, list)):
+            return tuple(signature(x, namespace) for x in obj)
+        elif isinstance(obj, (set, frozenset)):
+            # Sorted, as set order changes with string hashing from run to run
+            return ('set', tuple(sorted(repr(signature(x)) for x in obj)))
+        elif isinstance(obj, dict):
+            return ('dict', tuple((signature(k), signature(v)) for k, v in obj.items()))
+        else:
+            text = repr(obj)
+            # Default reprs hold addresses, which differ from run to run
+            if ' at 0x' in text:
+                return (type(obj).__module__, type(obj).__qualname__)
+            return text
+    digest = hashlib.sha1()
+    for rule in rules:
+        digest.update(repr((rule.lhs, rule.rhs, signature(rule.sem))).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class GrammarSnapshot(object):
+    """
+    The compiled rule tables of a Grammar, before any aliases or entity names.
+
+    A snapshot records every lexical, unary, and binary rule produced by
+    expanding optionals and n-ary rules, with its semantics referenced by a
+    stable ref (see resolve) instead of a function, so it can be pickled and
+    installed in a new Grammar without repeating the expansion.
+
+    :param entries: a list of (lhs, rhs, ref) in the order they were added
+    :param categories: the categories created for n-ary rules
+    :param fingerprint: the fingerprint of the rules the snapshot was built from
+    """
+    def __init__(self, entries, categories, fingerprint):
+        self.version = SNAPSHOT_VERSION
+        self.entries = entries
+        self.categories = categories
+        self.fingerprint = fingerprint
+        self._rules = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_rules'] = None
+        return state
+
+    def rules(self, source_rules):
+        """Returns the compiled Rules, resolving their semantics on first use."""
+        if self._rules is None:
+            self._rules = [Rule(lhs, rhs, resolve(ref, source_rules))
+                           for lhs, rhs, ref in self.entries]
+        return self._rules
+
+    def save(self, fpath):
+        with open(fpath, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(fpath):
+        with open(fpath, 'rb') as f:
+            snapshot = pickle.load(f)
+        if getattr(snapshot, 'version', None) != SNAPSHOT_VERSION:
+            raise ValueError("Grammar snapshot {} has version {}; expected {}.".format(
+                fpath, getattr(snapshot, 'version', None), SNAPSHOT_VERSION))
+        return snapshot
+
+
+# Snapshots compiled in this process, by fingerprint
+_snapshots = {}
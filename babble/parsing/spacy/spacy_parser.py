@@ -1,4 +1,4 @@
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 from .parser import Parser, ParserConnection
 
@@ -47,20 +47,46 @@ class Spacy(Parser):
 
     '''
     def __init__(self, annotators=['tagger', 'parser', 'entity'],
-                 lang='en', num_threads=1, verbose=False):
+                 lang='en', num_threads=1, verbose=False, cache_size=0):
 
         super(Spacy, self).__init__(name="spacy")
-        self.model = Spacy.load_lang_model(lang)
+        disable = [proc for proc in ['tagger', 'parser', 'entity']
+                   if proc not in annotators]
+        self.model = Spacy.load_lang_model(lang, disable=disable)
         self.num_threads = num_threads
+        # Without the dependency parser there are no sentence boundaries, so
+        # each document is treated as a single sentence.
+        self.split_sentences = 'parser' in annotators
+        self.cache = LRUCache(cache_size)
 
         self.pipeline = []
         if spacy_version==1:
             for proc in annotators:
                 self.pipeline += [self.model.__dict__[proc]]
         else:
-            annotators=[i if i!='entity' else 'ner' for i in annotators]
-            for i,proc in enumerate(annotators):
-                self.pipeline += [self.model.pipeline[i][1]]
+            components = dict(self.model.pipeline)
+            for proc in annotators:
+                self.pipeline += [components[proc if proc != 'entity' else 'ner']]
+
+    @staticmethod
+    def shared(annotators=['tagger', 'parser', 'entity'], lang='en',
+               cache_size=0):
+        '''
+        Return the Spacy instance with the given annotators and language that
+        is shared by all callers in this process, creating it if necessary.
+        If cache_size is larger than that of the existing instance's cache,
+        its cache is enlarged.
+        :param annotators:
+        :param lang:
+        :param cache_size: number of tokenized texts to keep
+        :return:
+        '''
+        key = (lang, tuple(annotators))
+        if key not in _parsers:
+            _parsers[key] = Spacy(annotators=annotators, lang=lang)
+        parser = _parsers[key]
+        parser.cache.capacity = max(parser.cache.capacity, cache_size)
+        return parser
 
     @staticmethod
     def model_installed(name):
@@ -74,10 +100,11 @@ class Spacy(Parser):
         return model_path.exists()
 
     @staticmethod
-    def load_lang_model(lang):
+    def load_lang_model(lang, disable=()):
         '''
         Load spaCy language model or download if
-        model is available and not installed
+        model is available and not installed. Each model is loaded once per
+        process for each set of disabled components.
 
         Currenty supported spaCy languages
 
@@ -87,31 +114,77 @@ class Spacy(Parser):
         es Spanish (377MB)
 
         :param lang:
+        :param disable: pipeline components not to load
+            ('tagger', 'parser', 'entity')
         :return:
         '''
-        if not Spacy.model_installed(lang):
-            download(lang)
-        return spacy.load(lang)
+        key = (lang, tuple(sorted(disable)))
+        if key not in _models:
+            if not Spacy.model_installed(lang):
+                download(lang)
+            if spacy_version==1:
+                _models[key] = spacy.load(lang, **{proc: False for proc in disable})
+            else:
+                disable = [proc if proc != 'entity' else 'ner' for proc in disable]
+                _models[key] = spacy.load(lang, disable=disable)
+        return _models[key]
 
     def connect(self):
         return ParserConnection(self)
 
     def parse(self, document, text):
         '''
-        Transform spaCy output to match CoreNLP's default format
+        Transform spaCy output to match CoreNLP's default format.
+        If the instance has a cache and no document is given, the (shared)
+        results for text are cached.
         :param document:
         :param text:
         :return:
         '''
+        if document is None and self.cache.capacity:
+            parts = self.cache.get(text)
+            if parts is None:
+                parts = list(self._parse(document, text))
+                self.cache.put(text, parts)
+            return iter(parts)
+        return self._parse(document, text)
+
+    def parse_batch(self, texts, batch_size=1000):
+        '''
+        Parse each of texts (with no document), running the pipeline over the
+        texts that are not cached in batches with nlp.pipe.
+        :param texts:
+        :param batch_size:
+        :return: a list with the list of sentence parts for each text
+        '''
+        results = [self.cache.get(text) if self.cache.capacity else None
+                   for text in texts]
+        missing = [i for i, parts in enumerate(results) if parts is None]
+        docs = self.model.pipe((self.to_unicode(texts[i]) for i in missing),
+                               batch_size=batch_size)
+        for i, doc in zip(missing, docs):
+            results[i] = list(self._sentences(None, doc))
+            if self.cache.capacity:
+                self.cache.put(texts[i], results[i])
+        return results
+
+    def _parse(self, document, text):
         text = self.to_unicode(text)
 
         doc = self.model.tokenizer(text)
         for proc in self.pipeline:
             proc(doc)
-        assert doc.is_parsed
+        return self._sentences(document, doc)
+
+    def _sentences(self, document, doc):
+        if self.split_sentences:
+            assert doc.is_parsed
+            sents = doc.sents
+        else:
+            sents = [doc]
 
         position = 0
-        for sent in doc.sents:
+        for sent in sents:
             parts = defaultdict(list)
             text = sent.text
 
@@ -147,3 +220,32 @@ class Spacy(Parser):
             position += 1
 
             yield parts
+
+
+class LRUCache(object):
+    '''
+    A dict of at most capacity items that evicts the least recently used.
+    '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+
+# Language models and shared Spacy instances loaded in this process
+_models = {}
+_parsers = {}
@@ -1,6 +1,8 @@
 from babble.parsing import Annotator
 
 class TokenAnnotator(Annotator):
+    categories = ['$QueryToken']
+
     def annotate(self, tokens):
         # Quotation marks are hard stops to prevent merging of multiple strings
         if len(tokens) == 1 and tokens[0]['pos'] not in ["``", "\'\'"]:
@@ -1,6 +1,7 @@
 from babble.parsing import GrammarMixin, Rule, sems0, sems1, sems_in_order, sems_reversed, flip_dir, star
 from babble.core import PrimitiveTemplate
-from babble.text.text_helpers import helpers
+from babble.parsing.compiler import Raw, Value, func_op, helper_op, value_op
+from babble.text.text_helpers import filter_pattern, helpers
 from babble.text.text_annotators import annotators
 
 lexical_rules = (
@@ -314,7 +315,39 @@ ops = {
     '.between': lambda x: lambda c: c['helpers']['get_between_phrase'](*[xi for xi in x(c)]),
     '.sentence': lambda c: c['helpers']['get_sentence_phrase'](c['candidate'][0]),
     '.extract_text': lambda phr: lambda c: getattr(phr(c), 'text').strip(),
-    '.filter': lambda phr, field, val: lambda c: c['helpers']['phrase_filter'](phr(c), field, val),
+    '.filter': lambda phr, field, val: (lambda pattern:
+        lambda c: c['helpers']['phrase_filter'](phr(c), field, pattern))(filter_pattern(val)),
+}
+
+def filter_op(compiler, phr, field, val):
+    if isinstance(val, Raw):
+        val = Raw(filter_pattern(val.value))
+    return Value('{}({}, {}, {})'.format(compiler.helper('phrase_filter'),
+        compiler.value(phr), compiler.literal(field), compiler.literal(val)))
+
+# The Python expressions computed by the ops above (see LFCompiler)
+compile_ops = {
+    # string functions
+    '.upper': func_op('{y}.isupper()', arity=0),
+    '.lower': func_op('{y}.islower()', arity=0),
+    '.capital': func_op('{capital}({y})', arity=0,
+        capital=lambda x: len(x) and x[0].isupper()),
+    '.startswith': func_op('{y}.startswith({0})'),
+    '.endswith': func_op('{y}.endswith({0})'),
+    '.index_word': helper_op('index_word'),
+
+    # context functions
+    '.arg_to_string': value_op('{arg_to_string}({0})',
+        arg_to_string=lambda x: x.strip() if isinstance(x, str) else x.entity.strip()),
+    '.cid': func_op("{y}.get_entity_attrib('entity_cids')[0]", arity=0),
+
+    '.left': helper_op('get_left_phrase'),
+    '.right': helper_op('get_right_phrase'),
+    '.within': helper_op('get_within_phrase'),
+    '.between': value_op('{get_between_phrase}(*{0})', helpers=['get_between_phrase']),
+    '.sentence': value_op('{get_sentence_phrase}(candidate[0])', helpers=['get_sentence_phrase']),
+    '.extract_text': value_op('{0}.text.strip()'),
+    '.filter': filter_op,
 }
 
 cmp_converter = {
@@ -376,6 +409,7 @@ translate_ops = {
 text_grammar = GrammarMixin(
     rules=rules,
     ops=ops,
+    compile_ops=compile_ops,
     helpers=helpers,
     annotators=annotators,
     translate_ops=translate_ops,
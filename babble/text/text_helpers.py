@@ -1,3 +1,4 @@
+from bisect import bisect_left, bisect_right
 from collections import namedtuple
 import re
 
@@ -9,13 +10,70 @@ inequalities = {
     '.gt': lambda x, y: x > y,
 }
 
+# The (start, stop) of the indices i in [lo, hi) of sorted values for which
+# inequalities[cmp](values[i], y) holds
+windows = {
+    '.lt': lambda values, lo, hi, y: (lo, bisect_left(values, y, lo, hi)),
+    '.leq': lambda values, lo, hi, y: (lo, bisect_right(values, y, lo, hi)),
+    '.eq': lambda values, lo, hi, y: (bisect_left(values, y, lo, hi),
+                                      bisect_right(values, y, lo, hi)),
+    '.geq': lambda values, lo, hi, y: (bisect_left(values, y, lo, hi), hi),
+    '.gt': lambda values, lo, hi, y: (bisect_right(values, y, lo, hi), hi),
+}
+
+# x cmp y if and only if -x reversed_inequalities[cmp] -y
+reversed_inequalities = {
+    '.lt': '.gt',
+    '.leq': '.geq',
+    '.eq': '.eq',
+    '.geq': '.leq',
+    '.gt': '.lt',
+}
+
+
+def _view_field(field):
+    """Returns a property that reads field of a Phrase off its sentence."""
+    slot = '_' + field
+
+    def getter(self):
+        if self.start is None:
+            return getattr(self.sentence, field) if self.sentence is not None else None
+        value = getattr(self, slot, None)
+        if value is None:
+            value = self._slice(field)
+            setattr(self, slot, value)
+        return value
+
+    return property(getter)
+
 
 class Phrase(object):
+    """
+    A read-only view of the tokens [start, stop) of a sentence.
+
+    Phrase(sentence) views the whole sentence, whose fields it returns as
+    they are, and slicing a Phrase returns a view of the same sentence, so
+    no fields are copied until they are read: each field of a slice is
+    sliced from the sentence the first time it is accessed, and kept for
+    later reads.
+    """
     fields = ['text', 'words', 'char_offsets', 'pos_tags', 'ner_tags', 'entity_types']
+    __slots__ = ('sentence', 'start', 'stop') + tuple('_' + field for field in fields)
 
-    def __init__(self, sentence=None):
-        for field in self.fields:
-            setattr(self, field, getattr(sentence, field) if sentence else None)
+    def __init__(self, sentence=None, start=None, stop=None):
+        """:param start: None for a view of the whole sentence"""
+        self.sentence = sentence if sentence else None
+        self.start = start
+        self.stop = stop
+
+    def _slice(self, field):
+        value = getattr(self.sentence, field)
+        if field == 'text':
+            char_offsets = self.sentence.char_offsets
+            text_start = char_offsets[self.start]
+            text_stop = char_offsets[self.stop] if self.stop < len(char_offsets) else None
+            return value[text_start:text_stop]
+        return value[self.start:self.stop]
 
     def __getitem__(self, key):
         if isinstance(key, slice):
@@ -25,22 +83,25 @@ class Phrase(object):
             assert isinstance(key, int)
             start = key
             stop = key + 1
-        p = Phrase()
-        text_start = self.char_offsets[start]
-        text_stop = self.char_offsets[stop] if stop < len(self.char_offsets) else None
-        p.text = self.text[text_start:text_stop]
-        p.words = self.words[start:stop]
-        p.char_offsets = self.char_offsets[start:stop]
-        p.pos_tags = self.pos_tags[start:stop]
-        p.ner_tags = self.ner_tags[start:stop]
-        p.entity_types = self.entity_types[start:stop]
-        return p
+        if self.start is not None:
+            # Slices of a view are views of the same sentence
+            start, stop = self.start + start, min(self.start + stop, self.stop)
+        # Like the text of the slice would, fail for starts past the sentence
+        self.sentence.char_offsets[start]
+        return Phrase(self.sentence, start, stop)
 
     def __len__(self):
-        return len(self.words)
+        words = self.sentence.words
+        if self.start is None:
+            return len(words)
+        return len(range(len(words))[self.start:self.stop])
 
     def __repr__(self):
-        return 'Phrase("{}" : {} tokens)'.format(self.text.strip(), len(self.words))
+        return 'Phrase("{}" : {} tokens)'.format(self.text.strip(), len(self))
+
+
+for _field in Phrase.fields:
+    setattr(Phrase, _field, _view_field(_field))
 
 
 def index_word(string, index):
@@ -63,46 +124,96 @@ def _index_wordlist(wordlist, index):
     return wordlist[max(0, min(index, len(wordlist) - 1))]
 
 
+def filter_pattern(val):
+    """Returns val compiled as the regex of phrase_filter, if it is a valid one."""
+    if isinstance(val, str):
+        try:
+            return re.compile(val)
+        except re.error:
+            pass
+    return val
+
+
+# {(id(tags), pattern): (tags, starts, ends)}
+tag_run_cache = {}
+TAG_RUN_CACHE_SIZE = 1024
+
+
+def tag_runs(tags, pattern):
+    """
+    Returns the starts and ends of the maximal runs of tags that pattern
+    matches, computed once per list of tags (normally a sentence's).
+    """
+    key = (id(tags), pattern)
+    entry = tag_run_cache.get(key)
+    if entry is None:
+        starts = []
+        ends = []
+        on = False
+        for i, tag in enumerate(tags):
+            if pattern.match(tag):
+                if not on:
+                    starts.append(i)
+                    ends.append(i + 1)
+                    on = True
+                else:
+                    ends[-1] = i + 1
+            else:
+                on = False
+        if len(tag_run_cache) >= TAG_RUN_CACHE_SIZE:
+            tag_run_cache.clear()
+        # Keeping tags keeps its id from being reused while it is cached
+        entry = tag_run_cache[key] = (tags, starts, ends)
+    return entry[1], entry[2]
+
+
 def phrase_filter(phr, field, val):
     if field == 'words':
-        return [key for key in getattr(phr, field) if re.match(val, key)]
+        match = filter_pattern(val).match
+        return [key for key in phr.words if match(key)]
     elif field == 'chars':
         return [c for c in phr.text.strip()]
     else: # NER
         # Don't count a two-token person (John Smith) as two people
+        sentence = phr.sentence
+        tags = getattr(sentence, field)
+        starts, ends = tag_runs(tags, filter_pattern(val))
+        tokens = range(len(tags))[phr.start:phr.stop]
+        if not tokens:
+            return []
+        # The runs that overlap the phrase, cut to it
+        first = bisect_right(ends, tokens.start)
+        last = bisect_left(starts, tokens.stop)
         results = []
-        on = False
-        for i, key in enumerate(getattr(phr, field)):
-            if re.match(val, key):
-                if not on:
-                    text_start = phr.char_offsets[i]
-                    results.append(phr.words[i])
-                    on = True
-                else:
-                    text_stop = phr.char_offsets[i + 1] if i + 1 < len(phr.char_offsets) else None
-                    results[-1] = phr.text[text_start:text_stop]
+        for i in range(first, last):
+            start = max(starts[i], tokens.start)
+            stop = min(ends[i], tokens.stop)
+            if stop - start == 1:
+                results.append(sentence.words[start])
             else:
-                on = False
+                char_offsets = sentence.char_offsets
+                text_stop = char_offsets[stop] if stop < len(char_offsets) else None
+                results.append(sentence.text[char_offsets[start]:text_stop])
         return results
 
 
 def get_left_phrase(entity, cmp='.gt', num=0, unit='words'):
     phrase = Phrase(entity)
     k = entity.word_start
-    indices = []
-    for i in range(k):
-        if unit == 'words':
-            if inequalities[cmp](-i, -k + num):
-                indices.append(i)
-        elif unit == 'chars':
-            I = entity.word_to_char_idx(i)
-            K = entity.word_to_char_idx(k)
-            if inequalities[cmp](-I, -K + num):
-                indices.append(i)
-        else:
-            raise Exception("Expected unit in ('words', 'chars'), got '{}'".format(unit))
-    if indices:
-        return phrase[min(indices):max(indices) + 1]
+    if k <= 0:
+        return phrase[0:0]
+    # Token i is kept if -i cmp -k + num, i.e., if i reversed-cmp k - num
+    if unit == 'words':
+        values = range(k)
+        bound = k - num
+    elif unit == 'chars':
+        values = entity.char_offsets
+        bound = values[k] - num
+    else:
+        raise Exception("Expected unit in ('words', 'chars'), got '{}'".format(unit))
+    start, stop = windows[reversed_inequalities[cmp]](values, 0, k, bound)
+    if start < stop:
+        return phrase[start:stop]
     else:
         return phrase[0:0]
 
@@ -110,24 +221,34 @@ def get_left_phrase(entity, cmp='.gt', num=0, unit='words'):
 def get_right_phrase(entity, cmp='.gt', num=0, unit='words'):
     phrase = Phrase(entity)
     k = entity.word_end
-    indices = []
-    for i in range(k + 1, len(phrase)):
-        if unit == 'words':
-            if inequalities[cmp](i, k + num):
-                indices.append(i)
-        elif unit == 'chars':
-            I = entity.word_to_char_idx(i)
-            K = entity.word_to_char_idx(k)
-            if inequalities[cmp](I, K + num):
-                indices.append(i)
-        else:
-            raise Exception("Expected unit in ('words', 'chars'), got '{}'".format(unit))
-    if indices:
-        return phrase[min(indices):max(indices) + 1]
+    n = len(phrase)
+    if k + 1 >= n:
+        return phrase[0:0]
+    if unit == 'words':
+        values = range(n)
+        bound = k + num
+    elif unit == 'chars':
+        values = entity.char_offsets
+        bound = values[k] + num
+    else:
+        raise Exception("Expected unit in ('words', 'chars'), got '{}'".format(unit))
+    start, stop = windows[cmp](values, k + 1, n, bound)
+    if start < stop:
+        return phrase[start:stop]
     else:
         return phrase[0:0]
 
 
+def char_to_word_index(char_offsets, c):
+    """
+    Returns the index of the word that character c is in, by binary search
+    over char_offsets: -1 for characters before the first word, and the
+    index of the last word for characters past the end of the sentence
+    (where metal's EntityMention.char_to_word_idx returns -1).
+    """
+    return bisect_right(char_offsets, c) - 1
+
+
 def get_within_phrase(entity, num=0, unit='words'):
     phrase = Phrase(entity)
     if unit == 'words':
@@ -136,8 +257,9 @@ def get_within_phrase(entity, num=0, unit='words'):
         return phrase[max(0, j - num):min(k + num + 1, len(phrase))]
     elif unit == 'chars':
         # Get the indices of the words at right distance, then index with those
-        j = max(0, entity.char_to_word_index(entity.char_start - num))
-        k = min(len(phrase), entity.char_to_word_index(entity.char_end + num))
+        char_offsets = entity.char_offsets
+        j = max(0, char_to_word_index(char_offsets, entity.char_start - num))
+        k = min(len(phrase), char_to_word_index(char_offsets, entity.char_end + num))
         return phrase[j:k]
     else:
         raise Exception("Expected unit in ('words', 'chars'), got '{}'".format(unit))
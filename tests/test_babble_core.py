@@ -2,6 +2,7 @@ import os
 import unittest
 
 from babble import SemanticParser
+from babble.core import is_number, text2int
 
 from test_babble_base import TestBabbleBase
 import core_explanations
@@ -35,4 +36,39 @@ class TestBabbleCore(TestBabbleBase):
     def test_translate(self):
         semantics = ('.root', ('.label', ('.bool', True), ('.and', ('.bool', True), ('.bool', True))))
         pseudocode = 'return 1 if (True and True) else 0'
-        self.assertEqual(self.sp.translate(semantics), pseudocode)
\ No newline at end of file
+        self.assertEqual(self.sp.translate(semantics), pseudocode)
+
+    def test_absorb_width(self):
+        self.sp.parse(core_explanations.absorption)
+        self.assertTrue(self.sp.grammar.chart.absorb_candidates > 0)
+        sp = SemanticParser(aliases=core_explanations.get_aliases(),
+                            max_absorb_width=2)
+        self.assertEqual(sp.parse(core_explanations.absorption), [])
+
+    def test_numbers(self):
+        self.assertEqual(text2int('twenty-first'), 21)
+        self.assertEqual(text2int('three hundred and two'), 302)
+        for word in ['twenty-first', 'three hundred and two', 'ninetieth']:
+            self.assertTrue(is_number(word))
+        for word in ['Three', 'wife', 'forty states']:
+            self.assertFalse(is_number(word))
+            with self.assertRaises(Exception):
+                text2int(word)
+
+    def test_compile(self):
+        grammar = self.sp.grammar
+        parses = self.sp.parse(core_explanations.logic + core_explanations.lists,
+                               return_parses=True)
+        for parse in parses:
+            self.assertIsNotNone(grammar.compiler.compile(parse.semantics))
+            candidate = parse.explanation.candidate
+            self.assertEqual(parse.function(candidate),
+                             grammar.interpret(parse.semantics)(candidate))
+
+    def test_plan(self):
+        parses = self.sp.parse(core_explanations.logic + core_explanations.lists,
+                               return_parses=True)
+        plan = self.sp.grammar.plan(parses)
+        for candidate in set(parse.explanation.candidate for parse in parses):
+            self.assertEqual(plan(candidate),
+                             [parse.function(candidate) for parse in parses])
@@ -0,0 +1,430 @@
+import os
+import tempfile
+from time import time
+import unittest
+
+from babble.parsing import Grammar, GrammarMixin, Parse, Rule
+from babble.parsing.aliases import AliasList, SubstringAutomaton
+from babble.parsing.chart import Chart
+from babble.parsing.compiler import literal_op, value_op
+from babble.parsing.helper_cache import HelperCache
+from babble.parsing.lexicon import TokenTrie
+from babble.parsing.parse import SemanticsTable, semantics_table
+from babble.parsing.parse_cache import ParseCache, cached_parse
+from babble.parsing.profiler import ParseProfiler
+from babble.parsing.snapshot import GrammarSnapshot, _snapshots
+from babble.parsing.spacy.spacy_parser import LRUCache, Spacy
+
+
+def toy_base(rules, root=Rule('$ROOT', '$Start $A $Stop', lambda sems: sems[1]),
+             ops={}, compile_ops=None):
+    """
+    Returns a GrammarMixin of rules, root and the rules for <START> and
+    <STOP> (by default, a $ROOT is a single $A between them).
+    """
+    rules = [root, Rule('$Start', '<START>'), Rule('$Stop', '<STOP>')] + rules
+    return GrammarMixin(rules, ops, {}, [], {}, compile_ops)
+
+
+class TestChart(unittest.TestCase):
+
+    def test_cells(self):
+        category_ids = {}
+        chart = Chart(3, category_ids)
+        chart.add(0, 1, Parse(Rule('$A', 'a'), ['a']))
+        chart.add(1, 3, Parse(Rule('$B', 'b c'), ['b', 'c']))
+        chart.add(1, 3, Parse(Rule('$A', 'b c'), ['b', 'c']))
+        self.assertEqual(chart.keys(), [(0, 1), (1, 3)])
+        self.assertEqual([p.rule.lhs for p in chart[(1, 3)]], ['$B', '$A'])
+        self.assertEqual(chart[(0, 3)], [])
+        self.assertEqual(sorted(category_ids), ['$A', '$B'])
+
+    def test_pairs(self):
+        category_ids = {'$A': 0, '$B': 1, '$C': 2}
+        chart = Chart(2, category_ids)
+        a = Parse(Rule('$A', 'a'), ['a'])
+        b = Parse(Rule('$B', 'b'), ['b'])
+        c = Parse(Rule('$C', 'c'), ['c'])
+        chart.add(0, 1, a)
+        chart.add(1, 2, c)
+        chart.add(1, 2, b)
+        rules = [Rule('$D', '$A $B')]
+        pairs = list(chart.cell(0, 1).pairs(chart.cell(1, 2), {0: {1: rules}}))
+        self.assertEqual(pairs, [(a, b, rules)])
+
+    def test_pack(self):
+        chart = Chart(1, {})
+        a = Parse(Rule('$A', 'a', 'x'), ['a'], absorbed=2)
+        b = Parse(Rule('$B', 'a', 'x'), ['a'])
+        c = Parse(Rule('$A', 'a', 'x'), ['a'], absorbed=1)
+        for parse in [a, b, c]:
+            chart.add(0, 1, parse)
+        chart.pack(0, 1)
+        self.assertEqual(chart[(0, 1)], [c, b])
+        self.assertEqual(chart.packed, 1)
+
+
+class TestParse(unittest.TestCase):
+
+    def test_lazy_semantics(self):
+        calls = []
+        rule = Rule('$B', '$A', lambda sems: calls.append(sems) or sems[0])
+        parse = Parse(rule, [Parse(Rule('$A', 'a', 'x'), ['a'])])
+        self.assertEqual(calls, [])
+        self.assertEqual(parse.semantics, 'x')
+        self.assertEqual(parse.semantics, 'x')
+        self.assertEqual(calls, [['x']])
+
+    def test_intern(self):
+        table = SemanticsTable()
+        a = table.intern(('.and', ('.bool', True), ('.int', 1)))
+        b = table.intern(('.and', ('.bool', True), ('.int', 1)))
+        self.assertIs(a, b)
+        self.assertIs(a[1], table.intern(('.bool', True)))
+        self.assertIsNot(table.intern(('.int', True)), a[2])
+        unhashable = ('.list', ['a'])
+        self.assertIs(table.intern(unhashable), unhashable)
+        # Semantics interned by another table are not copied
+        other = SemanticsTable()
+        self.assertIs(other.intern(a), a)
+        self.assertIs(other.intern(('.int', 1)), a[2])
+
+    def test_table_scope(self):
+        grammar = Grammar(toy_base([
+            Rule('$A', 'a', ('.int', 1)),
+            Rule('$A', '$A $A', lambda sems: ('.and',) + tuple(sems)),
+        ]), start_symbol='$ROOT')
+        sizes = []
+        for string in ['a a', 'a a a a a a', 'a a']:
+            grammar.parse_string(string)
+            sizes.append(len(semantics_table))
+        # The table only holds the semantics of the last parse
+        self.assertEqual(sizes[2], sizes[0])
+        self.assertLess(sizes[0], sizes[1])
+
+    def test_debug(self):
+        Parse(Rule('$B', '$A'), [Parse(Rule('$C', 'c'), ['c'])])
+        Parse.debug = True
+        try:
+            with self.assertRaises(AssertionError):
+                Parse(Rule('$B', '$A'), [Parse(Rule('$C', 'c'), ['c'])])
+        finally:
+            Parse.debug = False
+
+
+class TestLexicon(unittest.TestCase):
+
+    def test_scan(self):
+        trie = TokenTrie()
+        rule = Rule('$LessThan', 'less than', '.lt')
+        trie.entry(rule.rhs).rules = [rule]
+        trie.entry(['less']).alias = 'less'
+        matches = trie.scan(['<START>', 'less', 'than', 'five', '<STOP>'])
+        self.assertEqual(sorted(matches), [(1, 2), (1, 3)])
+        self.assertEqual(matches[(1, 2)].alias, 'less')
+        self.assertEqual(matches[(1, 3)].rules, [rule])
+
+
+class TestUnaryClosure(unittest.TestCase):
+
+    def test_cycle(self):
+        rules = [
+            Rule('$A', 'a', 'a'),
+            Rule('$B', '$A', lambda sems: ('b', sems[0])),
+            Rule('$A', '$B', lambda sems: ('a', sems[0])),
+        ]
+        grammar = Grammar(toy_base(rules), start_symbol='$ROOT')
+        levels = grammar.unary_closure('$A')
+        self.assertEqual([[(parent, rule.lhs) for parent, rule in level]
+                          for level in levels], [[(0, '$B')]])
+        self.assertEqual([p.semantics for p in grammar.parse_string('a')],
+                         ['a'])
+
+
+class TestPruning(unittest.TestCase):
+
+    def test_prune(self):
+        rules = [
+            Rule('$A', 'a', 'a'),
+            Rule('$A', '$A $Dead', lambda sems: sems[0]),
+            Rule('$Dead', '$Dead $A'),
+            Rule('$Unreachable', 'a'),
+        ]
+        base = toy_base(rules)
+        grammar = Grammar(base, start_symbol='$ROOT')
+        self.assertEqual(sorted(rule.lhs for rule in grammar.pruned_rules),
+                         ['$A', '$Dead', '$Unreachable'])
+        self.assertEqual(grammar.lexical_rules[('a',)], [rules[0]])
+        self.assertEqual([p.semantics for p in grammar.parse_string('a')], ['a'])
+        self.assertEqual(Grammar(base, prune=False).pruned_rules, [])
+
+
+class TestPrediction(unittest.TestCase):
+
+    def test_engines_agree(self):
+        rules = [
+            Rule('$A', '$B $C', lambda sems: sems),
+            Rule('$A', '$C', lambda sems: sems[0]),
+            Rule('$D', '$C $B', lambda sems: ('d',) + tuple(sems)),
+            Rule('$A', '$D ?$B', lambda sems: sems[0]),
+            Rule('$B', 'b', 'b'),
+            Rule('$C', 'c', 'c'),
+            Rule('$E', '$C $B', lambda sems: sems),
+        ]
+        base = toy_base(rules)
+        cky = Grammar(base, start_symbol='$ROOT', prune=False)
+        predictive = Grammar(base, start_symbol='$ROOT', prune=False,
+                             engine='predictive')
+        for string in ['b c', 'c b', 'c b b', 'b x c', 'c']:
+            self.assertEqual(
+                [(p.semantics, p.absorbed) for p in predictive.parse_string(string)],
+                [(p.semantics, p.absorbed) for p in cky.parse_string(string)])
+        predictive.parse_string('c b')
+        cky.parse_string('c b')
+        self.assertEqual([p.rule.lhs for p in predictive.chart[(1, 3)]], ['$D', '$A'])
+        self.assertEqual([p.rule.lhs for p in cky.chart[(1, 3)]], ['$D', '$E', '$A'])
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_counts(self):
+        rules = [
+            Rule('$A', 'a', 'a'),
+        ]
+        profiler = ParseProfiler()
+        grammar = Grammar(toy_base(rules),
+                          start_symbol='$ROOT', profiler=profiler)
+        grammar.parse_string('a')
+        grammar.parse_string('a')
+        self.assertEqual(profiler.num_parses, 2)
+        self.assertEqual(profiler.category_counts['$A'], 2)
+        self.assertEqual(profiler.rule_counts['$A -> a'], 2)
+        self.assertEqual(profiler.summary()['entries'], 2 * 5)
+        self.assertEqual([(c['i'], c['j']) for c in profiler.cells[:3]],
+                         [(0, 1), (1, 2), (2, 3)])
+
+
+class TestBudgets(unittest.TestCase):
+
+    def setUp(self):
+        # Every binary tree over the tokens is a parse of $A
+        self.base = toy_base([
+            Rule('$A', 'a', 'a'),
+            Rule('$A', '$A $A', lambda sems: tuple(sems)),
+        ])
+
+    def test_chart_entries(self):
+        grammar = Grammar(self.base, start_symbol='$ROOT')
+        self.assertEqual(len(grammar.parse_string('a x')), 1)
+        self.assertIsNone(grammar.chart.budget_exceeded)
+        budgeted = Grammar(self.base, start_symbol='$ROOT', max_chart_entries=1)
+        self.assertEqual(budgeted.parse_string('a x'), [])
+        self.assertEqual(budgeted.chart.budget_exceeded, 'chart entries')
+        # No more cells are filled once a budget is exceeded
+        budgeted = Grammar(self.base, start_symbol='$ROOT', max_chart_entries=500)
+        self.assertEqual(budgeted.parse_string(' '.join(['a'] * 100)), [])
+        self.assertEqual(budgeted.chart.budget_exceeded, 'chart entries')
+        self.assertLessEqual(budgeted.chart.size, 500 + 100)
+
+    def test_time(self):
+        budgeted = Grammar(self.base, start_symbol='$ROOT', max_parse_time=0.05)
+        tokens = budgeted.tokenize(' '.join(['a'] * 200))
+        start = time()
+        self.assertEqual(budgeted.parse_tokens(tokens), [])
+        self.assertLess(time() - start, 0.5)
+        self.assertEqual(budgeted.chart.budget_exceeded, 'time')
+
+
+class TestTiered(unittest.TestCase):
+
+    def test_fallback(self):
+        rules = [
+            Rule('$A', 'a', 'a'),
+            Rule('$A', '$A $A', lambda sems: sems),
+        ]
+        base = toy_base(rules)
+        full = Grammar(base, start_symbol='$ROOT')
+        tiered = Grammar(base, start_symbol='$ROOT', tiered=True)
+        for string, absorbed in [('a a', False), ('a x a', True)]:
+            self.assertEqual(
+                [(p.semantics, p.absorbed) for p in tiered.parse_string(string)],
+                [(p.semantics, p.absorbed) for p in full.parse_string(string)])
+            self.assertEqual(tiered.chart.absorb, absorbed)
+
+
+class TestCompiler(unittest.TestCase):
+
+    def test_fallback(self):
+        ops = {
+            '.root': lambda x: lambda c: x(c),
+            '.int': lambda x: lambda c: x,
+            '.neg': lambda x: lambda c: -x(c),
+        }
+        compile_ops = {
+            '.root': value_op('{0}'),
+            '.int': literal_op,
+        }
+        rules = [
+            Rule('$Int', 'one', ('.int', 1)),
+            Rule('$Minus', 'minus'),
+            Rule('$Int', '$Minus $Int', lambda sems: ('.neg', sems[1])),
+        ]
+        root = Rule('$ROOT', '$Start $Int $Stop', lambda sems: ('.root', sems[1]))
+        grammar = Grammar(toy_base(rules, root, ops, compile_ops), start_symbol='$ROOT')
+        compiled, interpreted = [grammar.parse_string(s)[0] for s in ['one', 'minus one']]
+        self.assertIsNotNone(grammar.compiler.compile(compiled.semantics))
+        self.assertIsNone(grammar.compiler.compile(interpreted.semantics))
+        self.assertEqual(grammar.evaluate(compiled)(None), 1)
+        self.assertEqual(grammar.evaluate(interpreted)(None), -1)
+        self.assertIsNot(grammar.evaluate(compiled), grammar.evaluate(compiled))
+
+
+class TestHelperCache(unittest.TestCase):
+
+    def test_lifecycle(self):
+        calls = []
+        def double(x):
+            calls.append(x)
+            return [x, x]
+        cache = HelperCache({'double': double})
+        helper = cache.helpers['double']
+        helper(1)
+        helper(1)
+        self.assertEqual(len(calls), 2)
+        with cache.candidate('a'):
+            self.assertIs(helper(1), helper(1))
+            helper([1])
+            helper([1])
+        self.assertEqual(calls, [1, 1, 1, [1], [1]])
+        self.assertIsNone(cache.entries)
+
+
+class TestAliases(unittest.TestCase):
+
+    def test_automaton(self):
+        automaton = SubstringAutomaton(['he', 'she', 'his', 'hers', 'his wife'])
+        self.assertEqual(automaton.find('ushers'), set(['he', 'she', 'hers']))
+        self.assertEqual(automaton.find('this wife'), set(['his', 'his wife']))
+        self.assertEqual(automaton.find(''), set())
+        self.assertEqual(SubstringAutomaton(['', 'a']).find('b'), set(['']))
+
+    def test_alias_list(self):
+        words = ['wife', 'husband', 'his wife'] + ['w{}'.format(i) for i in range(300)]
+        alias = AliasList(words)
+        self.assertEqual(alias, words)
+        self.assertIsNotNone(alias.automaton)
+        self.assertIn('husband', alias)
+        self.assertNotIn(['husband'], alias)
+        for container in ['and his wife', ['wife', 'w12'], ('w1',), set(['w2'])]:
+            self.assertEqual(alias.map_in(container), [w in container for w in words])
+        small = AliasList(['wife', 1])
+        self.assertIsNone(small.automaton)
+        self.assertEqual(small.map_in(['wife']), [True, False])
+        self.assertRaises(TypeError, small.map_in, 'his wife')
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        rules = [
+            Rule('$A', 'a', 'a'),
+            Rule('$B', 'b', 'b'),
+            Rule('$C', 'c', 'c'),
+        ]
+        root = Rule('$ROOT', '$Start $A ?$B $C $A $Stop', lambda sems: tuple(sems[1:-1]))
+        self.base = toy_base(rules, root)
+
+    def test_round_trip(self):
+        grammar = Grammar(self.base, start_symbol='$ROOT')
+        fd, fpath = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            grammar.snapshot.save(fpath)
+            _snapshots.clear()
+            loaded = Grammar(self.base, start_symbol='$ROOT', snapshot=fpath)
+        finally:
+            os.remove(fpath)
+        self.assertEqual(loaded.fingerprint, grammar.fingerprint)
+        for string in ['a b c a', 'a c a']:
+            self.assertEqual(
+                [p.semantics for p in loaded.parse_string(string)],
+                [p.semantics for p in grammar.parse_string(string)])
+        self.assertEqual(loaded.parse_string('a c a')[0].semantics,
+                         ('a', None, 'c', 'a'))
+
+    def test_mismatch(self):
+        snapshot = GrammarSnapshot([], set(), 'stale')
+        with self.assertRaises(ValueError):
+            Grammar(self.base, snapshot=snapshot)
+
+    def test_called_names(self):
+        # The two roots differ only in the name of the method they call
+        upper = toy_base([Rule('$A', 'a', 'hello')],
+                         Rule('$ROOT', '$Start $A $Stop', lambda sems: sems[1].upper()))
+        lower = toy_base([Rule('$A', 'a', 'hello')],
+                         Rule('$ROOT', '$Start $A $Stop', lambda sems: sems[1].lower()))
+        first = Grammar(upper, start_symbol='$ROOT')
+        second = Grammar(lower, start_symbol='$ROOT')
+        self.assertNotEqual(first.fingerprint, second.fingerprint)
+        self.assertEqual(first.parse_string('a')[0].semantics, 'HELLO')
+        self.assertEqual(second.parse_string('a')[0].semantics, 'hello')
+
+
+class TestSpacy(unittest.TestCase):
+
+    def test_shared(self):
+        parser = Spacy.shared(annotators=['tagger', 'entity'])
+        self.assertIs(Spacy.shared(annotators=['tagger', 'entity']), parser)
+        self.assertIs(parser.model,
+                      Spacy.load_lang_model('en', disable=['parser']))
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(list(cache.items), ['a', 'c'])
+        self.assertIsNone(cache.get('b'))
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.fpath = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.fpath)
+
+    def test_round_trip(self):
+        cache = ParseCache(self.fpath)
+        parses = [cached_parse(('.root', ('.bool', True)), 0),
+                  cached_parse(('.root', ('.string', u'caf\xe9')), 1)]
+        cache.put('a', parses)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(ParseCache(self.fpath).get('a'),
+            [(('.root', ('.bool', True)), 0), (('.root', ('.string', u'caf\xe9')), 1)])
+
+    def test_eviction(self):
+        cache = ParseCache(self.fpath, max_bytes=100)
+        for key in ['a', 'b', 'c']:
+            cache.put(key, [cached_parse(('.root', ('.string', key * 30)), 0)])
+        self.assertEqual(len(cache), 1)
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_grammar_state(self):
+        # The two roots differ only in the name of the method they call
+        upper = toy_base([Rule('$A', 'a', 'hello')],
+                         Rule('$ROOT', '$Start $A $Stop', lambda sems: sems[1].upper()))
+        lower = toy_base([Rule('$A', 'a', 'hello')],
+                         Rule('$ROOT', '$Start $A $Stop', lambda sems: sems[1].lower()))
+        self.assertNotEqual(
+            ParseCache.grammar_state(Grammar(upper, start_symbol='$ROOT')),
+            ParseCache.grammar_state(Grammar(lower, start_symbol='$ROOT')))
+
+    def test_grammar_state_parameters(self):
+        base = toy_base([Rule('$A', 'a', 'a')])
+        states = [ParseCache.grammar_state(Grammar(base, start_symbol='$ROOT', **kwargs))
+                  for kwargs in [{}, {'engine': 'predictive'}, {'prune': False}]]
+        self.assertEqual(len(set(states)), 3)
@@ -1,8 +1,11 @@
+from collections import namedtuple
 import pickle
 import os
 import unittest
 
 from babble import SemanticParser
+from babble.text.text_helpers import (Phrase, get_left_phrase, get_right_phrase,
+                                      get_within_phrase, phrase_filter)
 
 from test_babble_base import TestBabbleBase
 import text_explanations
@@ -50,4 +53,53 @@ class TestBabbleText(TestBabbleBase):
         self.check_explanations(text_explanations.tuples)
 
     def test_implicit_strings(self):
-        self.check_explanations(text_explanations.implicit_strings)
\ No newline at end of file
+        self.check_explanations(text_explanations.implicit_strings)
+
+    def test_phrase_views(self):
+        Sentence = namedtuple('Sentence', Phrase.fields)
+        words = ['Daniel', 'Ammann', 'bought', 'the', 'mansion']
+        sentence = Sentence(' '.join(words), words, [0, 7, 14, 21, 25],
+                            ['NNP', 'NNP', 'VBD', 'DT', 'NN'],
+                            ['PERSON', 'PERSON', 'O', 'O', 'O'], ['O'] * 5)
+        phrase = Phrase(sentence)
+        self.assertIs(phrase.words, words)
+        self.assertEqual(len(phrase), 5)
+        window = phrase[1:4]
+        self.assertIs(window.sentence, sentence)
+        self.assertEqual(len(window), 3)
+        self.assertEqual(window.text, 'Ammann bought the ')
+        self.assertEqual(window.ner_tags, ['PERSON', 'O', 'O'])
+        self.assertEqual(window[1:5].words, ['bought', 'the'])
+        self.assertEqual(phrase[4].text, 'mansion')
+        self.assertEqual(len(phrase[3:1]), 0)
+
+    def test_windows(self):
+        Entity = namedtuple('Entity', Phrase.fields +
+                            ['word_start', 'word_end', 'char_start', 'char_end'])
+        words = ['Daniel', 'Ammann', 'bought', 'the', 'mansion']
+        entity = Entity(' '.join(words), words, [0, 7, 14, 21, 25], None, None, None,
+                        2, 2, 14, 19)
+        self.assertEqual(get_left_phrase(entity, '.leq', 2).words, ['Daniel', 'Ammann'])
+        self.assertEqual(get_left_phrase(entity, '.lt', 2).words, ['Ammann'])
+        self.assertEqual(get_left_phrase(entity, '.gt', 2).words, [])
+        self.assertEqual(get_right_phrase(entity, '.lt', 10, 'chars').words, ['the'])
+        self.assertEqual(get_right_phrase(entity, '.geq', 10, 'chars').words, ['mansion'])
+        self.assertEqual(get_within_phrase(entity, 3, 'chars').words, ['Ammann', 'bought'])
+        # Windows past the end of the sentence end at its last word
+        last = entity._replace(word_start=3, word_end=3, char_start=21, char_end=23)
+        self.assertEqual(get_within_phrase(last, 20, 'chars').words,
+                         ['Daniel', 'Ammann', 'bought', 'the'])
+
+    def test_phrase_filter(self):
+        Sentence = namedtuple('Sentence', Phrase.fields)
+        words = ['GM', 'President', 'Daniel', 'Ammann', 'and', 'Pernilla', 'Ammann']
+        sentence = Sentence(' '.join(words), words, [0, 3, 13, 20, 27, 31, 40], None,
+                            ['ORG', 'O', 'PERSON', 'PERSON', 'O', 'PERSON', 'PERSON'], None)
+        phrase = Phrase(sentence)
+        self.assertEqual(phrase_filter(phrase, 'ner_tags', 'PERSON'),
+                         ['Daniel Ammann ', 'Pernilla Ammann'])
+        self.assertEqual(phrase_filter(phrase[1:6], 'ner_tags', 'PERSON'),
+                         ['Daniel Ammann ', 'Pernilla'])
+        self.assertEqual(phrase_filter(phrase[3:5], 'ner_tags', 'PERSON|ORG'), ['Ammann'])
+        self.assertEqual(phrase_filter(phrase[4:5], 'ner_tags', 'PERSON'), [])
+        self.assertEqual(phrase_filter(phrase[0:3], 'words', r'[A-Z]'), ['GM', 'President', 'Daniel'])